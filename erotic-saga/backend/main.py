@@ -1,15 +1,73 @@
-from fastapi import FastAPI, UploadFile, Form, HTTPException, BackgroundTasks
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from utils.ai_api import call_ai_edit_image, generate_questions
-from utils.file_manager import save_image_file, encode_image_base64, image_to_base64_to_front_end, load_characters, save_characters, UPLOAD_DIR
-from utils.question_loader import load_questions_for_character
+from utils.file_manager import save_image_file, encode_image_base64, image_to_base64_to_front_end, safe_folder_name, load_characters, update_characters, allocate_character_ids, folder_ids, reserved_record, public_record, publish_characters, discard_reserved_characters, storage, local_assets, UPLOAD_DIR
+from utils.question_loader import load_questions_for_character, validate_questions
+from utils.archive import iter_export_archive, scan_character_archive, import_character_archive, ARCHIVE_FORMATS
+from utils.character_index import character_index, INDEX_REPAIR_ON_STARTUP
+from utils.question_cache import QuestionSetCache, QuestionWarmer, load_warm_topics, WARMER_API_KEY
+from utils.scheduler import ai_scheduler, INTERACTIVE, BACKGROUND
+from utils.analytics import analytics, EVENT_VIEW, EVENT_ANSWER, EVENT_WIN, EVENT_GAME_OVER
+from contextlib import asynccontextmanager
 from typing import List
-import base64
 import os
 import requests
 
 
-app = FastAPI(title="AI Millionaire Game")
+def generate_questions_scheduled(api_key: str, topic: str, difficulties: list[int], num_questions: int, priority: str = INTERACTIVE, on_submit=None):
+    """
+    Run generate_questions through the shared AI scheduler (interactive by default).
+    on_submit receives the scheduler Future, so the question cache can promote it.
+    """
+    future = ai_scheduler.submit(
+        priority, api_key, generate_questions,
+        api_key=api_key, topic=topic, difficulties=difficulties, num_questions=num_questions
+    )
+    if on_submit:
+        on_submit(future)
+    return future.result()
+
+
+def promote_question_job(future, priority: str = INTERACTIVE):
+    """
+    An interactive request joined a queued generation (e.g. the warmer's): run it as interactive.
+    """
+    ai_scheduler.promote(future, priority)
+
+
+# Generated question sets, shared by identical (topic, difficulties, num_questions) requests
+question_cache = QuestionSetCache(generate_questions_scheduled, promote=promote_question_job)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Index the uploads/ tree once at boot instead of listing folders on every request
+    await run_in_threadpool(character_index.load_or_build, INDEX_REPAIR_ON_STARTUP)
+
+    # Gameplay analytics: events are buffered in memory and flushed to SQLite in the background
+    analytics.start()
+
+    # Optionally pre-generate question sets for popular topics
+    warmer = None
+    warm_topics = load_warm_topics()
+    if WARMER_API_KEY and warm_topics:
+        warmer = QuestionWarmer(question_cache, WARMER_API_KEY, warm_topics, priority=BACKGROUND)
+        warmer.start()
+        if not question_cache.shared:
+            print("⚠️ Question cache is scoped per API key (QUESTION_CACHE_SHARED=0): warmed sets only "
+                  "serve requests made with WARMER_API_KEY. Set QUESTION_CACHE_SHARED=1 to share them.")
+
+    yield
+
+    if warmer:
+        warmer.stop()
+    ai_scheduler.shutdown()
+    await run_in_threadpool(analytics.stop)
+
+
+app = FastAPI(title="AI Millionaire Game", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -73,7 +131,7 @@ async def get_default_background():
     """
     bg_path = "default_background.jpg"
     try:
-        image_data = image_to_base64_to_front_end(bg_path)
+        image_data = await run_in_threadpool(image_to_base64_to_front_end, bg_path, source=local_assets)
         return {"image": image_data}
     except Exception as e:
         print(f"❌ Error reading default background: {e}")
@@ -84,18 +142,33 @@ async def get_default_background():
 # 🔹 API 1: Get all characters
 # ===============================================
 
+def find_character(character_id: int):
+    """
+    Look up a published character in the (briefly cached) characters.json.
+    Characters still being uploaded / imported are not playable. Blocking: run it in the threadpool.
+    """
+    return next(
+        (c for c in load_characters(cached=True) if c["id"] == character_id and not c.get("importing")),
+        None
+    )
+
+
 @app.get("/api/characters")
 async def get_characters():
     """
     Return a list of all characters (id, name, original_image, folder)
     """
-    characters = load_characters()
-    for char in characters:
-        img_path = char.get("original_image")
-        if img_path:
-            char["image"] = image_to_base64_to_front_end(img_path)
+    def list_characters():
+        # Characters still being imported are hidden until their files are in place
+        characters = [c for c in load_characters(cached=True) if not c.get("importing")]
+        for char in characters:
+            img_path = char.get("original_image")
+            if img_path:
+                char["image"] = image_to_base64_to_front_end(img_path)
+        return characters
 
-    return characters
+    # Storage reads (S3 round trips) must not block the event loop
+    return await run_in_threadpool(list_characters)
 
 
 
@@ -124,31 +197,10 @@ async def upload(
         try:
             questions = json.loads(questions_json)
             
-            # Check if it's an array
-            if not isinstance(questions, list):
-                raise HTTPException(status_code=400, detail="Questions must be an array")
-            
-            # Validate each question
-            for idx, q in enumerate(questions, start=1):
-                # Check required fields
-                if not isinstance(q, dict):
-                    raise HTTPException(status_code=400, detail=f"Question {idx} must be an object")
-                
-                required_fields = ["id", "question", "options", "answer"]
-                for field in required_fields:
-                    if field not in q:
-                        raise HTTPException(status_code=400, detail=f"Question {idx} missing required field: {field}")
-                
-                # Validate options
-                if not isinstance(q["options"], list):
-                    raise HTTPException(status_code=400, detail=f"Question {idx}: options must be an array")
-                
-                if len(q["options"]) != 4:
-                    raise HTTPException(status_code=400, detail=f"Question {idx}: must have exactly 4 options")
-                
-                # Validate that answer is one of the options
-                if q["answer"] not in q["options"]:
-                    raise HTTPException(status_code=400, detail=f"Question {idx}: answer '{q['answer']}' must be one of the options")
+            # Validate every question and report all errors at once
+            errors = validate_questions(questions)
+            if errors:
+                raise HTTPException(status_code=400, detail="\n".join(errors))
             
             validated_questions = questions
             print(f"✅ All {len(questions)} questions validated successfully")
@@ -160,65 +212,72 @@ async def upload(
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"Error validating questions: {str(e)}")
 
-    # Ensure the uploads directory exists
-    os.makedirs(UPLOAD_DIR, exist_ok=True)
-
-    # === Determine the new character ID ===
-    characters = load_characters()
-    new_id = len(characters) + 1
-    existing_ids = {c.get("id", 0) for c in characters}
-    while new_id in existing_ids:
-        new_id += 1
-
-
-    # === Normalize folder name: "id_name" ===
-    safe_name = name.replace(" ", "_").lower()
-    folder_name = f"{new_id}_{safe_name}"
-    character_folder = os.path.join(UPLOAD_DIR, folder_name)
-    os.makedirs(character_folder, exist_ok=True)
-
-    # Save the original character image in a separate folder
     image_ext = os.path.splitext(image.filename)[1] or ".png"
-    image_path = os.path.join(character_folder, f"0{image_ext}")
-    original_image =image_path
+    safe_name = safe_folder_name(name)
+    image_data = await image.read()
+
+    # === Reserve the new character ID in one atomic update ===
+    # (so concurrent uploads on other workers / nodes never get the same id).
+    # The record stays hidden ("importing") until its files are written, like an archive import.
+    existing_folder_ids = await run_in_threadpool(folder_ids)
+
+    def register_character(characters):
+        new_id = allocate_character_ids(characters, 1, exclude=existing_folder_ids)[0]
+
+        # === Normalize folder name: "id_name" ===
+        character_folder = os.path.join(UPLOAD_DIR, f"{new_id}_{safe_name}")
+        new_character = reserved_record({
+            "id": new_id,
+            "name": name,
+            # The original character image is saved in the character folder
+            "original_image": os.path.join(character_folder, f"0{image_ext}"),
+            "folder": character_folder
+        })
+        characters.append(new_character)
+        return new_character
+
+    new_character = public_record(await run_in_threadpool(update_characters, register_character))
+    character_folder = new_character["folder"]
+    original_image = new_character["original_image"]
+
+    def write_character_files():
+        """Write the source image and questions, or roll the reservation back."""
+        written = []
+        try:
+            storage.write_bytes(original_image, image_data)
+            written.append(original_image)
+
+            # Save questions JSON
+            if validated_questions:
+                # Edit id to increase from 1
+                for idx, q in enumerate(validated_questions, start=1):
+                    q['id'] = idx
+                questions_path = os.path.join(character_folder, "questions.json")
+                data = json.dumps(validated_questions, ensure_ascii=False, indent=2)
+                storage.write_bytes(questions_path, data.encode("utf-8"))
+                written.append(questions_path)
+                print(f"✅ Questions saved to {questions_path}")
+        except BaseException:
+            discard_reserved_characters([new_character["id"]], written)
+            raise
+        publish_characters([new_character["id"]])
 
-    with open(image_path, "wb") as f:
-        f.write(await image.read())
+    try:
+        await run_in_threadpool(write_character_files)
+    except Exception as e:
+        print(f"❌ Error saving character '{name}': {e}")
+        raise HTTPException(status_code=500, detail=f"Upload failed, nothing was saved: {str(e)}")
 
-    # Save questions JSON and character info first
-    if validated_questions:
-        try:
-            # Edit id to increase from 1
-            for idx, q in enumerate(validated_questions, start=1):
-                q['id'] = idx
-            questions_path = os.path.join(character_folder, "questions.json")
-            with open(questions_path, "w", encoding="utf-8") as f:
-                json.dump(validated_questions, f, ensure_ascii=False, indent=2)
-            print(f"✅ Questions saved to {questions_path}")
-        except Exception as e:
-            print(f"⚠️ Error saving questions: {e}")
-
-    # Update character information in JSON file
-    characters = load_characters()
-    new_character = {
-        "id": new_id,
-        "name": name,
-        "original_image": original_image,
-        "folder": character_folder
-    }
-    characters.append(new_character)
-    save_characters(characters)
+    await run_in_threadpool(character_index.refresh, new_character)
 
     # Define background task for generating images
-    def generate_images_background():
-        """Generate images in the background to avoid blocking other requests"""
-        # Generate images through the AI API
-        # Use the original image for every prompt (do not update image_path)
-        for idx, prompt in enumerate(prompts, start=1):
+    def save_generated_images(jobs):
+        """Download each generated image as soon as its job is done"""
+        for idx, (prompt, job) in enumerate(zip(prompts, jobs), start=1):
             print(f"🎨 Processing prompt {idx}/{len(prompts)}: {prompt[:60]}...")
 
             # Always use the original image for each call
-            result_url = call_ai_edit_image(api_key, original_image, prompt)
+            result_url = job.result()
 
             if not result_url:
                 print(f"⚠️ Prompt {idx} failed, skipping.")
@@ -233,16 +292,34 @@ async def upload(
                 new_filename = f"{idx}{image_ext}"
                 new_path = os.path.join(character_folder, new_filename)
 
-                with open(new_path, "wb") as out_file:
-                    out_file.write(res.content)
+                storage.write_bytes(new_path, res.content)
+                character_index.refresh(new_character)
 
                 print(f"✅ Image {idx} saved at: {new_path}")
 
             except Exception as e:
                 print(f"❌ Error downloading image {idx}: {e}")
                 continue
+
+    def generate_images_background():
+        """Generate images in the background to avoid blocking other requests"""
+        # Generate images through the AI API
+        # Queue every prompt as background work on the shared scheduler so that
+        # interactive requests and other tenants are not starved by a large upload.
+        # Use the original image for every prompt (do not update image_path)
+        try:
+            jobs = [
+                ai_scheduler.submit(BACKGROUND, api_key, call_ai_edit_image, api_key, original_image, prompt)
+                for prompt in prompts
+            ]
+            save_generated_images(jobs)
+        finally:
+            # Back to rate-limited rescans once nothing more will be generated
+            character_index.generation_finished(new_character["id"])
+            character_index.refresh(new_character)
     
-    # Add background task
+    # Add background task (the index rescans this folder on every request until it is done)
+    character_index.generation_started(new_character["id"])
     background_tasks.add_task(generate_images_background)
 
     return {
@@ -251,6 +328,93 @@ async def upload(
     }
 
 
+# =====================================================
+# 📦 API: Bulk export / import characters as an archive
+# =====================================================
+@app.get("/api/characters/export")
+async def export_characters(format: str = "zip", ids: str = None):
+    """
+    Stream a zip / tar / tar.gz archive of character folders.
+    - ids: optional comma-separated character ids (default: all characters)
+    """
+    if format not in ARCHIVE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format '{format}'. Use one of: {', '.join(ARCHIVE_FORMATS)}")
+
+    # Characters still being uploaded / imported have half-written folders: never export them
+    characters = [c for c in await run_in_threadpool(load_characters) if not c.get("importing")]
+    if ids:
+        try:
+            wanted = {int(i) for i in ids.split(",") if i.strip()}
+        except ValueError:
+            raise HTTPException(status_code=400, detail="ids must be a comma-separated list of integers")
+        characters = [c for c in characters if c["id"] in wanted]
+
+    return StreamingResponse(
+        iter_export_archive(characters, format),
+        media_type=ARCHIVE_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="characters.{format}"'}
+    )
+
+
+@app.post("/api/characters/import")
+async def import_characters(archive: UploadFile = File(...)):
+    """
+    Import many characters from a zip / tar archive with one folder per character
+    (0.* source image, generated images, questions.json).
+    Every folder is validated first; if anything is invalid, all errors are returned
+    and nothing is imported. Otherwise all characters are registered in one batch.
+    """
+    entries, errors, warnings = await run_in_threadpool(scan_character_archive, archive.file)
+    if errors:
+        raise HTTPException(status_code=400, detail={
+            "message": f"❌ Archive rejected: {len(errors)} error(s) found",
+            "errors": errors,
+            "warnings": warnings
+        })
+
+    try:
+        new_characters = await run_in_threadpool(import_character_archive, archive.file, entries)
+    except ValueError as e:
+        # Corrupt image data is only read during the import (already rolled back)
+        raise HTTPException(status_code=400, detail={
+            "message": "❌ Archive rejected: nothing was imported",
+            "errors": [str(e)],
+            "warnings": warnings
+        })
+    except Exception as e:
+        print(f"❌ Error importing characters: {e}")
+        raise HTTPException(status_code=500, detail=f"Import failed, nothing was imported: {str(e)}")
+
+    # Index the new folders in parallel, off the event loop
+    await run_in_threadpool(character_index.refresh_many, new_characters)
+
+    return {
+        "message": f"✅ Imported {len(new_characters)} characters successfully!",
+        "characters": new_characters,
+        "warnings": warnings
+    }
+
+
+# =====================================================
+# 🗂️ API: Character index (consistency of uploads/ vs characters.json)
+# =====================================================
+@app.get("/api/index")
+async def get_index_report():
+    """
+    Return the current index summary: orphan folders, missing files and other issues.
+    """
+    return character_index.report()
+
+
+@app.post("/api/index/rebuild")
+async def rebuild_index(repair: bool = Form(False)):
+    """
+    Rescan all character folders now. With repair=true, fix wrong original_image paths
+    and register complete orphan folders as characters.
+    """
+    return await run_in_threadpool(character_index.build, repair)
+
+
 # =====================================================
 # 🧠 API: Generate questions using AI
 # =====================================================
@@ -268,7 +432,9 @@ async def generate_questions_api(
         # Convert difficulties from FormData (strings) to integers
         difficulties_int = [int(d) for d in difficulties]
         
-        questions = generate_questions(
+        # Served from the cache when possible; identical in-flight requests share one AI call
+        questions, source = await run_in_threadpool(
+            question_cache.get_or_generate,
             api_key=api_key,
             topic=topic,
             difficulties=difficulties_int,
@@ -279,7 +445,8 @@ async def generate_questions_api(
             return {
                 "success": True,
                 "questions": questions,
-                "count": len(questions)
+                "count": len(questions),
+                "source": source
             }
         else:
             return {
@@ -294,14 +461,49 @@ async def generate_questions_api(
         }
 
 
+@app.get("/api/scheduler/metrics")
+async def get_scheduler_metrics():
+    """
+    Return queue lengths, running calls and queue-wait times of the AI scheduler
+    per priority class and per (masked) API key.
+    """
+    return ai_scheduler.metrics()
+
+
+@app.get("/api/question-cache")
+async def get_question_cache_stats():
+    """
+    Return hit / miss / coalesced counters of the generated question cache.
+    """
+    return question_cache.stats()
+
+
+# =====================================================
+# 📊 API: Gameplay statistics (precomputed rollups)
+# =====================================================
+@app.get("/api/stats/characters")
+async def get_all_character_stats():
+    """
+    Return games started, answers, wins, game overs and win rate for every character.
+    """
+    return await run_in_threadpool(analytics.all_character_stats)
+
+
+@app.get("/api/stats/characters/{character_id}")
+async def get_character_stats(character_id: int):
+    """
+    Return the stats of one character with per-question views, answers and correct rate.
+    """
+    return await run_in_threadpool(analytics.character_stats, character_id)
+
+
 @app.post("/api/question/{qid}")
 async def get_question(qid: int, character_id: int = Form(...)):
     """
     Return the question and corresponding image
     """
     # Find character by ID
-    characters = load_characters()
-    char = next((c for c in characters if c["id"] == character_id), None)
+    char = await run_in_threadpool(find_character, character_id)
     if not char:
         return {"error": "❌ Character not found!"}
 
@@ -310,7 +512,7 @@ async def get_question(qid: int, character_id: int = Form(...)):
 
     # Load questions for this character
     try:
-        questions = load_questions_for_character(folder_path)
+        questions = await run_in_threadpool(load_questions_for_character, folder_path)
     except FileNotFoundError as e:
         return {"error": str(e)}
 
@@ -318,22 +520,14 @@ async def get_question(qid: int, character_id: int = Form(...)):
         return {"done": True, "message": "🎉 You have completed the game!"}
 
     question = questions[qid - 1]
+    analytics.record(EVENT_VIEW, character_id, qid)
 
-
-    # Get list of files image
-    image_extensions = (".jpg", ".jpeg", ".png", ".gif", ".webp")
-    files = [
-        f for f in os.listdir(folder_path)
-        if os.path.isfile(os.path.join(folder_path, f))
-        and f.lower().endswith(image_extensions)
-    ]
-
-    # Sort alphabetically
-    files.sort()
+    # Get list of files image (sorted alphabetically, from the character index)
+    files = await run_in_threadpool(character_index.images, char)
 
     image = files[qid - 1] if qid - 1 < len(files) else ""
     image_path = os.path.join(folder_path, image)
-    image_data = image_to_base64_to_front_end(image_path)
+    image_data = await run_in_threadpool(image_to_base64_to_front_end, image_path)
     
     return {"question": question, "image": image_data, "character_name": char["name"]}
 
@@ -347,8 +541,7 @@ async def submit_answer(question_id: int = Form(...), answer: str = Form(...), c
 
     # Folder containing images
     # Find character
-    characters = load_characters()
-    char = next((c for c in characters if c["id"] == character_id), None)
+    char = await run_in_threadpool(find_character, character_id)
     if not char:
         return {"correct": False, "message": "❌ Character not found!"}
 
@@ -356,40 +549,33 @@ async def submit_answer(question_id: int = Form(...), answer: str = Form(...), c
 
     # Load questions for the character
     try:
-        questions = load_questions_for_character(folder_path)
+        questions = await run_in_threadpool(load_questions_for_character, folder_path)
     except FileNotFoundError as e:
         return {"correct": False, "message": str(e)}
 
     question = questions[question_id - 1]
     correct = (answer.strip().lower() == question["answer"].strip().lower())
+    analytics.record(EVENT_ANSWER, character_id, question_id, correct)
 
     if not correct:
+        analytics.record(EVENT_GAME_OVER, character_id, question_id)
         return {"correct": False, "message": "❌ Wrong answer! Game Over."}
 
     next_id = question_id + 1
 
     
 
-    # Get list of files image
-    image_extensions = (".jpg", ".jpeg", ".png", ".gif", ".webp")
-    files = [
-        f for f in os.listdir(folder_path)
-        if os.path.isfile(os.path.join(folder_path, f))
-        and f.lower().endswith(image_extensions)
-    ]
-    files.sort()
+    # Get list of files image (sorted alphabetically, from the character index)
+    files = await run_in_threadpool(character_index.images, char)
 
     # If the player wins (no more questions)
     if next_id > len(questions) or next_id > len(files)-1:
+        analytics.record(EVENT_WIN, character_id, question_id)
         last_img = files[-1] if len(files) > 0 else None
         image_data = None
         if last_img:
             img_path = os.path.join(folder_path, last_img)
-            ext = os.path.splitext(img_path)[1].lower()
-            mime_type = "image/png" if ext not in [".jpg", ".jpeg"] else "image/jpeg"
-            with open(img_path, "rb") as image_file:
-                b64 = base64.b64encode(image_file.read()).decode("utf-8")
-                image_data = f"data:{mime_type};base64,{b64}"
+            image_data = await run_in_threadpool(image_to_base64_to_front_end, img_path)
 
         return {
             "correct": True,
@@ -403,7 +589,7 @@ async def submit_answer(question_id: int = Form(...), answer: str = Form(...), c
     next_img = files[next_id - 1] if next_id - 1 < len(files) else ""
     next_img_path = os.path.join(folder_path, next_img)
 
-    image_data = image_to_base64_to_front_end(next_img_path)
+    image_data = await run_in_threadpool(image_to_base64_to_front_end, next_img_path)
 
     return {
         "correct": True,
@@ -0,0 +1,108 @@
+import sqlite3
+
+import pytest
+
+from utils.analytics import AnalyticsPipeline, EVENT_VIEW, EVENT_ANSWER, EVENT_WIN, EVENT_GAME_OVER
+
+
+def test_failed_flush_keeps_events_for_retry(tmp_path, monkeypatch):
+    pipeline = AnalyticsPipeline(db_path=str(tmp_path / "analytics.db"), batch_size=2)
+    pipeline.start()
+    pipeline.stop()
+
+    for question_id in range(1, 4):
+        pipeline.record(EVENT_VIEW, 1, question_id)
+    pipeline.record(EVENT_ANSWER, 1, 3, correct=True)
+
+    write_batch = pipeline._write_batch
+    calls = []
+
+    def failing_second_batch(batch):
+        calls.append(batch)
+        if len(calls) == 2:
+            raise sqlite3.OperationalError("database is locked")
+        write_batch(batch)
+
+    monkeypatch.setattr(pipeline, "_write_batch", failing_second_batch)
+    with pytest.raises(sqlite3.OperationalError):
+        pipeline.flush()
+    assert [e[1:4] for e in pipeline._buffer] == [("view", 1, 3), ("answer", 1, 3)]
+
+    assert pipeline.flush() == 2
+    stats = pipeline.character_stats(1)
+    assert stats["games_started"] == 1
+    assert stats["answers"] == 1
+    assert [q["views"] for q in stats["questions"]] == [1, 1, 1]
+
+
+def test_buffer_is_capped_and_drops_oldest_events(tmp_path, monkeypatch):
+    pipeline = AnalyticsPipeline(db_path=str(tmp_path / "analytics.db"), batch_size=2, max_buffer=3)
+
+    def locked(batch):
+        # New events arrive while the write is failing
+        pipeline.record(EVENT_VIEW, 1, 9)
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(pipeline, "_write_batch", locked)
+    for question_id in range(1, 5):
+        pipeline.record(EVENT_VIEW, 1, question_id)
+    assert pipeline.dropped == 1
+
+    with pytest.raises(sqlite3.OperationalError):
+        pipeline.flush()
+    assert [e[3] for e in pipeline._buffer] == [3, 4, 9]
+    assert pipeline.dropped == 2
+
+
+def test_stop_logs_flush_errors_instead_of_raising(tmp_path, monkeypatch, capsys):
+    pipeline = AnalyticsPipeline(db_path=str(tmp_path / "analytics.db"))
+    pipeline.record(EVENT_VIEW, 1, 1)
+
+    def locked(batch):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(pipeline, "_write_batch", locked)
+    pipeline.stop()
+    assert "final flush failed" in capsys.readouterr().out
+
+
+def play(pipeline, character_id, answers):
+    """
+    Record one game: `answers` are the correctness of each answered question, in order.
+    """
+    for question_id, correct in enumerate(answers, start=1):
+        pipeline.record(EVENT_VIEW, character_id, question_id)
+        pipeline.record(EVENT_ANSWER, character_id, question_id, correct)
+        if not correct:
+            pipeline.record(EVENT_GAME_OVER, character_id, question_id)
+            return
+    pipeline.record(EVENT_WIN, character_id, len(answers))
+
+
+def test_rollups_across_wins_game_overs_and_batches(tmp_path):
+    pipeline = AnalyticsPipeline(db_path=str(tmp_path / "analytics.db"), batch_size=3)
+    pipeline.start()
+    pipeline.stop()
+
+    play(pipeline, 1, [True, True])
+    play(pipeline, 1, [False])
+    assert pipeline.flush() == 8
+    play(pipeline, 1, [True, False])
+    pipeline.record(EVENT_VIEW, 2, 1)
+    assert pipeline.flush() == 6
+
+    stats = pipeline.character_stats(1)
+    assert {k: stats[k] for k in ("games_started", "answers", "correct_answers", "wins", "game_overs")} == {
+        "games_started": 3, "answers": 5, "correct_answers": 3, "wins": 1, "game_overs": 2,
+    }
+    assert stats["win_rate"] == 0.3333
+    assert stats["correct_rate"] == 0.6
+    assert [(q["question_id"], q["views"], q["answers"], q["correct_answers"], q["correct_rate"]) for q in stats["questions"]] == [
+        (1, 3, 3, 2, 0.6667),
+        (2, 2, 2, 1, 0.5),
+    ]
+
+    summary = {s["character_id"]: s for s in pipeline.all_character_stats()}
+    assert summary[1]["win_rate"] == 0.3333
+    assert (summary[2]["games_started"], summary[2]["win_rate"], summary[2]["correct_rate"]) == (1, 0.0, None)
+    assert pipeline.character_stats(3)["win_rate"] is None
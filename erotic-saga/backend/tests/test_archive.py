@@ -0,0 +1,179 @@
+import io
+import json
+import zipfile
+import pytest
+from utils import storage as storage_module
+from utils.storage import LocalStorage
+from utils.archive import scan_character_archive, import_character_archive, iter_export_archive
+from utils.file_manager import load_characters
+
+QUESTIONS = [
+    {"id": i, "question": f"Q{i}", "options": ["a", "b", "c", "d"], "answer": "a"}
+    for i in range(1, 3)
+]
+
+
+@pytest.fixture
+def store(tmp_path):
+    previous = storage_module.get_storage()
+    storage_module.set_storage(LocalStorage(str(tmp_path / "root")))
+    yield tmp_path
+    storage_module.set_storage(previous)
+
+
+def make_zip(files: dict) -> io.BytesIO:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    buffer.seek(0)
+    return buffer
+
+
+def character_files(folder: str) -> dict:
+    return {
+        f"{folder}/0.jpg": b"source",
+        f"{folder}/1.jpg": b"one",
+        f"{folder}/2.jpg": b"two",
+        f"{folder}/questions.json": json.dumps(QUESTIONS),
+    }
+
+
+def test_import_valid_archive(store):
+    archive = make_zip({
+        "characters.json": json.dumps([{"folder": "2_laurent", "name": "Laurent"}]),
+        **character_files("2_laurent"),
+    })
+    entries, errors, warnings = scan_character_archive(archive)
+    assert errors == [] and warnings == []
+
+    new_characters = import_character_archive(archive, entries)
+    assert [c["name"] for c in new_characters] == ["Laurent"]
+    assert load_characters() == new_characters
+    assert (store / "root" / new_characters[0]["folder"] / "2.jpg").read_bytes() == b"two"
+
+
+def test_manifest_name_cannot_escape_uploads(store):
+    archive = make_zip({
+        "characters.json": json.dumps([{"folder": "2_x", "name": "x/../../../../../tmp/pwned"}]),
+        **character_files("2_x"),
+    })
+    _, errors, _ = scan_character_archive(archive)
+    assert any("invalid name" in e for e in errors)
+
+
+class FailingStorage(LocalStorage):
+    """
+    Local storage that fails on the n-th write of a file under uploads/.
+    """
+
+    def __init__(self, root, fail_at):
+        super().__init__(root)
+        self.fail_at = fail_at
+        self.upload_writes = 0
+
+    def write_bytes(self, path, data):
+        if path.startswith("uploads"):
+            self.upload_writes += 1
+            if self.upload_writes == self.fail_at:
+                raise OSError("disk full")
+        super().write_bytes(path, data)
+
+
+def test_failed_import_leaves_nothing_behind(store):
+    root = store / "root"
+    storage_module.set_storage(FailingStorage(str(root), fail_at=6))
+    archive = make_zip({**character_files("2_laurent"), **character_files("3_anna")})
+    entries, errors, _ = scan_character_archive(archive)
+    assert errors == []
+
+    with pytest.raises(OSError):
+        import_character_archive(archive, entries)
+
+    assert load_characters() == []
+    assert list((root / "uploads").iterdir()) == []
+
+
+def test_import_ids_skip_existing_characters_and_folders(store):
+    root = store / "root"
+    (root / "uploads" / "2_orphan").mkdir(parents=True)
+    storage_module.get_storage().write_bytes("characters.json", json.dumps([{"id": 1, "name": "A", "folder": "uploads/1_a"}]).encode())
+
+    archive = make_zip(character_files("9_laurent"))
+    entries, _, _ = scan_character_archive(archive)
+    new_characters = import_character_archive(archive, entries)
+
+    assert [c["id"] for c in new_characters] == [3]
+    assert all("importing" not in c for c in load_characters())
+
+
+def test_truncated_tar_is_reported_as_error(store):
+    import tarfile
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as archive:
+        for name, data in character_files("2_laurent").items():
+            data = data.encode() if isinstance(data, str) else data * 1000
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    truncated = io.BytesIO(buffer.getvalue()[:3000])
+
+    _, errors, _ = scan_character_archive(truncated)
+    assert any("corrupt or truncated" in e for e in errors)
+
+
+def test_corrupt_zip_member_is_reported_as_error(store):
+    data = make_zip(character_files("2_laurent")).getvalue()
+    # Flip bytes inside the stored questions.json payload to break its CRC
+    index = data.index(b'"question"')
+    corrupt = io.BytesIO(data[:index] + b"X" * 10 + data[index + 10:])
+
+    _, errors, _ = scan_character_archive(corrupt)
+    assert any("corrupt" in e for e in errors)
+
+
+def test_garbage_is_not_an_archive(store):
+    _, errors, _ = scan_character_archive(io.BytesIO(b"not an archive at all"))
+    assert errors == ["Archive must be a .zip, .tar or .tar.gz file"]
+
+
+@pytest.mark.parametrize("members", [
+    ["a/2_x/0.jpg", "b/2_x/0.jpg"],
+    ["2_x/sub/0.jpg"],
+])
+def test_nested_folders_are_rejected(store, members):
+    archive = make_zip({**{m: b"image" for m in members}, "2_x/questions.json": json.dumps(QUESTIONS)})
+    _, errors, _ = scan_character_archive(archive)
+    assert sum("Nested folder" in e for e in errors) == len(members)
+
+
+def test_duplicate_files_are_rejected(store):
+    archive = make_zip({**character_files("2_x"), "./2_x/0.jpg": b"other"})
+    _, errors, _ = scan_character_archive(archive)
+    assert errors == ["2_x: duplicate file 0.jpg"]
+
+
+@pytest.mark.parametrize("fmt", ["zip", "tar", "tar.gz"])
+def test_export_import_round_trip(store, fmt):
+    archive = make_zip({
+        "characters.json": json.dumps([
+            {"folder": "1_laurent", "name": "Laurent"},
+            {"folder": "2_anna", "name": "Anna Maria"},
+        ]),
+        **character_files("1_laurent"),
+        **character_files("2_anna"),
+    })
+    entries, _, _ = scan_character_archive(archive)
+    originals = import_character_archive(archive, entries)
+
+    exported = io.BytesIO(b"".join(iter_export_archive(originals, fmt)))
+    entries, errors, warnings = scan_character_archive(exported)
+    assert errors == [] and warnings == []
+    copies = import_character_archive(exported, entries)
+
+    assert [c["name"] for c in copies] == ["Laurent", "Anna Maria"]
+    assert [c["id"] for c in copies] == [3, 4]
+    root = store / "root"
+    for original, copy in zip(originals, copies):
+        for filename in ["0.jpg", "1.jpg", "2.jpg", "questions.json"]:
+            assert (root / copy["folder"] / filename).read_bytes() == (root / original["folder"] / filename).read_bytes()
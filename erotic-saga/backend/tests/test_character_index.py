@@ -0,0 +1,171 @@
+import json
+import pytest
+from utils import storage as storage_module
+from utils.storage import LocalStorage
+from utils.character_index import CharacterIndex
+from utils.file_manager import load_characters
+
+QUESTIONS = [
+    {"id": i, "question": f"Q{i}", "options": ["a", "b", "c", "d"], "answer": "a"}
+    for i in range(1, 3)
+]
+
+
+@pytest.fixture
+def store(tmp_path):
+    previous = storage_module.get_storage()
+    storage_module.set_storage(LocalStorage(str(tmp_path / "root")))
+    yield tmp_path
+    storage_module.set_storage(previous)
+
+
+@pytest.fixture
+def index(store):
+    return CharacterIndex(snapshot_file=str(store / "index.json"), workers=2)
+
+
+def write_character(folder: str, images: int = 3, questions=QUESTIONS):
+    backend = storage_module.get_storage()
+    for i in range(images):
+        backend.write_bytes(f"{folder}/{i}.jpg", f"image {i}".encode())
+    if questions is not None:
+        backend.write_bytes(f"{folder}/questions.json", json.dumps(questions).encode())
+
+
+def register(*characters):
+    storage_module.get_storage().write_bytes("characters.json", json.dumps(list(characters)).encode())
+
+
+def character(char_id: int, folder: str, original: str = None) -> dict:
+    return {
+        "id": char_id,
+        "name": folder.split("_", 1)[1].title(),
+        "original_image": original or f"uploads/{folder}/0.jpg",
+        "folder": f"uploads/{folder}",
+    }
+
+
+def issues(report) -> list:
+    return sorted(((p["id"], p["folder"], p["issue"]) for p in report["problems"]), key=lambda p: (p[1], p[2]))
+
+
+def test_build_indexes_characters_and_flags_problems(index):
+    write_character("uploads/1_anna")
+    write_character("uploads/2_bob", images=2)
+    write_character("uploads/3_orphan")
+    register(character(1, "1_anna"), character(2, "2_bob"), character(4, "4_gone"))
+
+    report = index.build()
+
+    assert report["characters"] == 3
+    assert report["orphans"] == ["uploads/3_orphan"]
+    assert issues(report) == [
+        (2, "uploads/2_bob", "not_enough_images"),
+        (None, "uploads/3_orphan", "orphan_folder"),
+        (4, "uploads/4_gone", "missing_folder"),
+    ]
+    assert index.manifests[1]["images"] == ["0.jpg", "1.jpg", "2.jpg"]
+    assert index.manifests[1]["question_count"] == 2
+
+
+def test_repair_fixes_original_image_and_adopts_complete_orphans(index):
+    write_character("uploads/1_anna")
+    write_character("uploads/5_complete")
+    write_character("uploads/6_incomplete", images=1)
+    register(character(1, "1_anna", original="uploads/1_anna/0.png"))
+
+    report = index.build(repair=True)
+
+    characters = {c["id"]: c for c in load_characters()}
+    assert characters[1]["original_image"] == "uploads/1_anna/0.jpg"
+    assert characters[5]["folder"] == "uploads/5_complete"
+    assert characters[5]["name"] == "Complete"
+    assert "uploads/6_incomplete" not in {c["folder"] for c in characters.values()}
+    assert len(report["repairs"]) == 2
+    assert issues(report) == [(None, "uploads/6_incomplete", "orphan_folder")]
+
+
+def test_snapshot_is_reused_until_a_folder_changes(store, index):
+    write_character("uploads/1_anna", images=2)
+    register(character(1, "1_anna"))
+    index.build()
+
+    warm = CharacterIndex(snapshot_file=str(store / "index.json"), workers=2)
+    assert warm.load_or_build()["source"] == "snapshot"
+    assert warm.manifests[1]["issues"] == ["not_enough_images"]
+
+    # A file added inside the folder does not change characters.json or the folder list
+    storage_module.get_storage().write_bytes("uploads/1_anna/2.jpg", b"image 2")
+    cold = CharacterIndex(snapshot_file=str(store / "index.json"), workers=2)
+    report = cold.load_or_build()
+    assert report["source"] == "scan"
+    assert report["problems"] == []
+
+
+def test_snapshot_is_ignored_when_characters_change(store, index):
+    write_character("uploads/1_anna")
+    register(character(1, "1_anna"))
+    index.build()
+
+    write_character("uploads/2_bob")
+    register(character(1, "1_anna"), character(2, "2_bob"))
+    warm = CharacterIndex(snapshot_file=str(store / "index.json"), workers=2)
+    assert warm.load_or_build()["source"] == "scan"
+    assert sorted(warm.manifests) == [1, 2]
+
+
+def test_refresh_updates_problems_and_orphans(index):
+    write_character("uploads/1_anna", images=1)
+    register()
+    assert issues(index.build()) == [(None, "uploads/1_anna", "orphan_folder")]
+
+    # The folder gets registered (e.g. by an import) and its images arrive
+    anna = character(1, "1_anna")
+    index.refresh(anna)
+    assert issues(index.report()) == [(1, "uploads/1_anna", "not_enough_images")]
+    assert index.report()["orphans"] == []
+
+    write_character("uploads/1_anna")
+    index.refresh(anna)
+    assert index.report()["problems"] == []
+
+
+def test_images_rescans_incomplete_folders_only_while_generating(index):
+    write_character("uploads/1_anna", images=1)
+    anna = character(1, "1_anna")
+    register(anna)
+    index.build()
+    index.rescan_interval = 3600
+    backend = storage_module.get_storage()
+
+    # Rescanned on every call while this process generates the images
+    index.generation_started(1)
+    backend.write_bytes("uploads/1_anna/1.jpg", b"image 1")
+    assert index.images(anna) == ["0.jpg", "1.jpg"]
+
+    # Generation over (one image failed): no more per-request rescans
+    index.generation_finished(1)
+    index.refresh(anna)
+    backend.write_bytes("uploads/1_anna/2.jpg", b"late image")
+    assert index.images(anna) == ["0.jpg", "1.jpg"]
+
+    # ... until the rescan interval has passed
+    index.rescan_interval = 0
+    assert index.images(anna) == ["0.jpg", "1.jpg", "2.jpg"]
+
+
+def test_stale_reservation_is_reported_and_reaped(store, index):
+    import time
+    write_character("uploads/1_ghost", images=1, questions=None)
+    register(
+        {**character(1, "1_ghost"), "importing": True, "reserved_at": 0},
+        {**character(2, "2_busy"), "importing": True, "reserved_at": time.time()},
+    )
+
+    report = index.build()
+    assert issues(report) == [(1, "uploads/1_ghost", "stale_reservation")]
+
+    report = index.build(repair=True)
+    assert report["problems"] == []
+    assert [c["id"] for c in load_characters()] == [2]
+    assert not (store / "root" / "uploads" / "1_ghost").exists()
@@ -0,0 +1,124 @@
+import time
+import threading
+
+from utils.question_cache import QuestionSetCache
+
+
+def make_loader(calls):
+    def loader(api_key, topic, difficulties, num_questions, **kwargs):
+        calls.append(api_key)
+        return [{"question": f"{topic} by {api_key}", "difficulty": d} for d in difficulties]
+    return loader
+
+
+def test_entries_are_scoped_by_api_key():
+    calls = []
+    cache = QuestionSetCache(make_loader(calls), shared=False)
+
+    first, source = cache.get_or_generate("key-a", "Science", [1, 2], 2)
+    assert source == "generated"
+    assert cache.get_or_generate("key-a", "  science ", [1, 2], 2)[1] == "cache"
+
+    other, source = cache.get_or_generate("key-b", "Science", [1, 2], 2)
+    assert source == "generated"
+    assert other != first
+    assert calls == ["key-a", "key-b"]
+
+
+def test_shared_cache_reuses_sets_across_keys():
+    calls = []
+    cache = QuestionSetCache(make_loader(calls), shared=True)
+
+    cache.get_or_generate("key-a", "Science", [1], 1)
+    assert cache.get_or_generate("key-b", "Science", [1], 1)[1] == "cache"
+    assert calls == ["key-a"]
+
+
+def test_waiter_with_other_loader_kwargs_promotes_in_flight_job():
+    started = threading.Event()
+    release = threading.Event()
+    promotions = []
+
+    def loader(api_key, topic, difficulties, num_questions, priority="interactive", on_submit=None):
+        on_submit(f"job-{priority}")
+        started.set()
+        release.wait(5)
+        return [{"question": topic, "difficulty": d} for d in difficulties]
+
+    cache = QuestionSetCache(loader, shared=False, promote=lambda job, **kwargs: promotions.append((job, kwargs)))
+    warmer = threading.Thread(
+        target=cache.get_or_generate, args=("key-a", "Science", [1], 1), kwargs={"priority": "background"}
+    )
+    warmer.start()
+    started.wait(5)
+
+    result = []
+    waiter = threading.Thread(target=lambda: result.append(cache.get_or_generate("key-a", "Science", [1], 1)))
+    waiter.start()
+    while not cache.stats()["coalesced"]:
+        time.sleep(0.01)
+    release.set()
+    warmer.join(5)
+    waiter.join(5)
+
+    assert promotions == [("job-background", {})]
+    assert result[0][1] == "coalesced"
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    calls = []
+    cache = QuestionSetCache(make_loader(calls), ttl=60, shared=False)
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+
+    cache.get_or_generate("key-a", "Science", [1], 1)
+    now[0] += 59
+    assert cache.get_or_generate("key-a", "Science", [1], 1)[1] == "cache"
+    now[0] += 2
+    assert cache.get_or_generate("key-a", "Science", [1], 1)[1] == "generated"
+    assert len(calls) == 2
+
+
+def test_least_recently_used_entry_is_evicted():
+    calls = []
+    cache = QuestionSetCache(make_loader(calls), max_size=2, shared=False)
+
+    cache.get_or_generate("key-a", "Science", [1], 1)
+    cache.get_or_generate("key-a", "History", [1], 1)
+    cache.get_or_generate("key-a", "Science", [1], 1)  # Science is now the most recent
+    cache.get_or_generate("key-a", "Music", [1], 1)    # evicts History
+
+    assert cache.stats()["entries"] == 2
+    assert cache.get_or_generate("key-a", "Science", [1], 1)[1] == "cache"
+    assert cache.get_or_generate("key-a", "History", [1], 1)[1] == "generated"
+
+
+def test_identical_concurrent_requests_share_one_loader_call():
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def loader(api_key, topic, difficulties, num_questions):
+        calls.append(topic)
+        started.set()
+        release.wait(5)
+        return [{"question": topic, "difficulty": d} for d in difficulties]
+
+    cache = QuestionSetCache(loader, shared=False)
+    results = []
+
+    def request():
+        results.append(cache.get_or_generate("key-a", "Science", [1, 2], 2))
+
+    threads = [threading.Thread(target=request) for _ in range(3)]
+    threads[0].start()
+    started.wait(5)
+    [t.start() for t in threads[1:]]
+    while cache.stats()["coalesced"] < 2:
+        time.sleep(0.01)
+    release.set()
+    [t.join(5) for t in threads]
+
+    assert calls == ["Science"]
+    assert sorted(source for _, source in results) == ["coalesced", "coalesced", "generated"]
+    assert all(questions == results[0][0] for questions, _ in results)
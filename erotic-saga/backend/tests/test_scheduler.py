@@ -0,0 +1,99 @@
+import time
+import threading
+
+import pytest
+
+from utils.scheduler import AIScheduler, INTERACTIVE, BACKGROUND
+
+
+def wait_running(scheduler, priority, count):
+    deadline = time.time() + 5
+    while scheduler.metrics()["classes"][priority]["running"] != count:
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def test_interactive_first_then_weighted_fair_share_between_keys():
+    scheduler = AIScheduler(max_concurrency=1, background_concurrency=1, weights={"heavy": 2.5})
+    release = threading.Event()
+    order = []
+
+    blocker = scheduler.submit(BACKGROUND, "blocker", release.wait, 5)
+    wait_running(scheduler, BACKGROUND, 1)
+
+    # Both keys queue 4 calls; "heavy" (weight 2.5) gets ~2.5 turns for each "light" turn
+    futures = [scheduler.submit(BACKGROUND, "heavy", order.append, f"heavy-{i}") for i in range(4)]
+    futures += [scheduler.submit(BACKGROUND, "light", order.append, f"light-{i}") for i in range(4)]
+    # Interactive work submitted last still runs before every queued background call
+    futures.append(scheduler.submit(INTERACTIVE, "admin", order.append, "interactive"))
+
+    release.set()
+    for future in [blocker, *futures]:
+        future.result(timeout=5)
+
+    assert order == [
+        "interactive",
+        "heavy-0", "heavy-1", "light-0", "heavy-2", "heavy-3",
+        "light-1", "light-2", "light-3",
+    ]
+    scheduler.shutdown()
+
+
+def test_background_cap_keeps_slots_for_interactive_work():
+    scheduler = AIScheduler(max_concurrency=3, background_concurrency=1)
+    release = threading.Event()
+
+    background = [scheduler.submit(BACKGROUND, "uploader", release.wait, 5) for _ in range(3)]
+    wait_running(scheduler, BACKGROUND, 1)
+
+    # Two slots are free but background work may only use one of them
+    time.sleep(0.05)
+    metrics = scheduler.metrics()["classes"][BACKGROUND]
+    assert (metrics["running"], metrics["queued"]) == (1, 2)
+
+    assert scheduler.submit(INTERACTIVE, "admin", lambda: "done").result(timeout=5) == "done"
+
+    release.set()
+    for future in background:
+        future.result(timeout=5)
+    scheduler.shutdown()
+
+
+def test_promoted_task_runs_before_background_queue():
+    scheduler = AIScheduler(max_concurrency=1, background_concurrency=1)
+    release = threading.Event()
+    order = []
+
+    blocker = scheduler.submit(BACKGROUND, "uploader", release.wait)
+    queued = [scheduler.submit(BACKGROUND, "uploader", order.append, i) for i in range(3)]
+    warm = scheduler.submit(BACKGROUND, "warmer", order.append, "warm")
+
+    assert scheduler.promote(warm, INTERACTIVE)
+    assert not scheduler.promote(warm, INTERACTIVE)
+    release.set()
+    for future in [blocker, *queued, warm]:
+        future.result(timeout=5)
+
+    assert order[0] == "warm"
+    assert scheduler.metrics()["classes"][INTERACTIVE]["promoted"] == 1
+    scheduler.shutdown()
+
+
+def test_shutdown_fails_queued_futures():
+    scheduler = AIScheduler(max_concurrency=1, background_concurrency=1)
+    release = threading.Event()
+
+    running = scheduler.submit(BACKGROUND, "uploader", release.wait, 5)
+    queued = [scheduler.submit(BACKGROUND, "uploader", lambda: "never") for _ in range(3)]
+    wait_running(scheduler, BACKGROUND, 1)
+
+    scheduler.shutdown()
+    for future in queued:
+        with pytest.raises(RuntimeError, match="shutting down"):
+            future.result(timeout=1)
+    with pytest.raises(RuntimeError):
+        scheduler.submit(BACKGROUND, "uploader", lambda: None)
+
+    release.set()
+    assert running.result(timeout=5) is True
+    assert scheduler.metrics()["classes"][BACKGROUND]["queued"] == 0
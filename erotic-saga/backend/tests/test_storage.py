@@ -0,0 +1,314 @@
+import io
+import json
+import threading
+import pytest
+from utils import storage as storage_module
+from utils.storage import LocalStorage, S3Storage, CachedStorage
+
+
+class FakeClientError(Exception):
+    """
+    Mimics botocore's ClientError: the error code lives in `response`.
+    """
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {"Error": {"Code": code}}
+
+
+class FakePaginator:
+    def __init__(self, client):
+        self.client = client
+
+    def paginate(self, Bucket, Prefix, Delimiter):
+        contents, prefixes = [], set()
+        for key in sorted(self.client.objects[Bucket]):
+            if not key.startswith(Prefix):
+                continue
+            rest = key[len(Prefix):]
+            if Delimiter in rest:
+                prefixes.add(Prefix + rest.split(Delimiter)[0] + Delimiter)
+            else:
+                contents.append({"Key": key, "ETag": self.client._etag(self.client.objects[Bucket][key])})
+        yield {"Contents": contents, "CommonPrefixes": [{"Prefix": p} for p in sorted(prefixes)]}
+
+
+class FakeS3Client:
+    """
+    In-memory stand-in for the boto3 S3 client calls used by S3Storage.
+    """
+
+    def __init__(self, bucket):
+        self.objects = {bucket: {}}
+        self.calls = []
+        self.before_put = None  # hook to simulate another node writing concurrently
+
+    def _etag(self, data):
+        return f'"{hash(data)}"'
+
+    def get_object(self, Bucket, Key):
+        self.calls.append(("get_object", Key))
+        if Key not in self.objects[Bucket]:
+            raise FakeClientError("NoSuchKey")
+        data = self.objects[Bucket][Key]
+        return {"Body": io.BytesIO(data), "ETag": self._etag(data)}
+
+    def put_object(self, Bucket, Key, Body, IfMatch=None, IfNoneMatch=None):
+        self.calls.append(("put_object", Key))
+        if self.before_put:
+            hook, self.before_put = self.before_put, None
+            hook()
+        current = self.objects[Bucket].get(Key)
+        if IfNoneMatch == "*" and current is not None:
+            raise FakeClientError("PreconditionFailed")
+        if IfMatch is not None and (current is None or self._etag(current) != IfMatch):
+            raise FakeClientError("PreconditionFailed")
+        self.objects[Bucket][Key] = bytes(Body)
+
+    def head_object(self, Bucket, Key):
+        self.calls.append(("head_object", Key))
+        if Key not in self.objects[Bucket]:
+            raise FakeClientError("404")
+        return {"ETag": self._etag(self.objects[Bucket][Key])}
+
+    def delete_object(self, Bucket, Key):
+        self.calls.append(("delete_object", Key))
+        self.objects[Bucket].pop(Key, None)
+
+    def get_paginator(self, name):
+        assert name == "list_objects_v2"
+        return FakePaginator(self)
+
+
+@pytest.fixture
+def s3():
+    client = FakeS3Client("bucket")
+    return client, S3Storage("bucket", prefix="app", client=client)
+
+
+def test_s3_write_and_read_bytes(s3):
+    client, backend = s3
+    backend.write_bytes("uploads/2_laurent/0.jpg", b"image")
+    assert client.objects["bucket"] == {"app/uploads/2_laurent/0.jpg": b"image"}
+    assert backend.read_bytes("uploads\\2_laurent/./0.jpg") == b"image"
+
+
+def test_s3_read_missing_raises_file_not_found(s3):
+    _, backend = s3
+    with pytest.raises(FileNotFoundError):
+        backend.read_bytes("uploads/missing.jpg")
+
+
+def test_s3_exists_and_delete(s3):
+    _, backend = s3
+    backend.write_bytes("characters.json", b"[]")
+    assert backend.exists("characters.json")
+    backend.delete("characters.json")
+    assert not backend.exists("characters.json")
+
+
+def test_s3_listdir_and_listdirs(s3):
+    _, backend = s3
+    for path in ["uploads/2_laurent/0.jpg", "uploads/2_laurent/questions.json", "uploads/3_anna/0.png", "uploads/top.txt"]:
+        backend.write_bytes(path, b"x")
+    assert sorted(backend.listdir("uploads/2_laurent")) == ["0.jpg", "questions.json"]
+    assert backend.listdir("uploads") == ["top.txt"]
+    assert backend.listdirs("uploads") == ["2_laurent", "3_anna"]
+    assert backend.listdir("uploads/missing") == []
+
+
+def test_s3_update_bytes_retries_on_concurrent_write(s3):
+    client, backend = s3
+    backend.write_bytes("characters.json", b"[1]")
+
+    # Another node appends 2 between our read and our conditional write
+    def other_node():
+        client.objects["bucket"]["app/characters.json"] = b"[1, 2]"
+    client.before_put = other_node
+
+    def append_three(data):
+        return json.dumps(json.loads(data) + [3]).encode()
+
+    assert backend.update_bytes("characters.json", append_three) == b"[1, 2, 3]"
+    assert client.objects["bucket"]["app/characters.json"] == b"[1, 2, 3]"
+
+
+def test_s3_update_bytes_creates_missing_object(s3):
+    client, backend = s3
+    backend.update_bytes("characters.json", lambda data: b"[]" if data is None else data)
+    assert client.objects["bucket"]["app/characters.json"] == b"[]"
+
+
+def test_local_update_bytes_is_atomic(tmp_path):
+    backend = LocalStorage(str(tmp_path))
+
+    def increment(data):
+        return str(int(data or b"0") + 1).encode()
+
+    threads = [
+        threading.Thread(target=lambda: [backend.update_bytes("counter", increment) for _ in range(50)])
+        for _ in range(4)
+    ]
+    [t.start() for t in threads]
+    [t.join() for t in threads]
+    assert backend.read_bytes("counter") == b"200"
+
+
+def test_cache_read_through(s3, tmp_path):
+    client, backend = s3
+    backend.write_bytes("uploads/2_laurent/0.jpg", b"image")
+    cached = CachedStorage(backend, str(tmp_path))
+
+    assert cached.read_bytes("uploads/2_laurent/0.jpg") == b"image"
+    assert (tmp_path / "uploads/2_laurent/0.jpg").read_bytes() == b"image"
+
+    client.calls.clear()
+    assert cached.read_bytes("uploads/2_laurent/0.jpg") == b"image"
+    assert client.calls == []
+
+
+def test_cache_write_through(s3, tmp_path):
+    client, backend = s3
+    cached = CachedStorage(backend, str(tmp_path))
+    cached.write_bytes("uploads/2_laurent/1.jpg", b"generated")
+
+    assert client.objects["bucket"]["app/uploads/2_laurent/1.jpg"] == b"generated"
+    assert (tmp_path / "uploads/2_laurent/1.jpg").read_bytes() == b"generated"
+
+
+def test_cache_uncached_paths_always_hit_backend(s3, tmp_path):
+    client, backend = s3
+    cached = CachedStorage(backend, str(tmp_path), uncached=("characters.json",))
+    cached.write_bytes("characters.json", b"[1]")
+    assert not (tmp_path / "characters.json").exists()
+
+    # Another node updates the file: the next read must see it
+    client.objects["bucket"]["app/characters.json"] = b"[1, 2]"
+    assert cached.read_bytes("characters.json") == b"[1, 2]"
+
+
+def test_cache_delete_removes_both_copies(s3, tmp_path):
+    client, backend = s3
+    cached = CachedStorage(backend, str(tmp_path))
+    cached.write_bytes("uploads/a.jpg", b"x")
+    cached.delete("uploads/a.jpg")
+    assert not cached.exists("uploads/a.jpg")
+    assert "app/uploads/a.jpg" not in client.objects["bucket"]
+
+
+def test_set_storage_applies_to_file_manager(tmp_path):
+    from utils import file_manager
+    previous = storage_module.get_storage()
+    try:
+        storage_module.set_storage(LocalStorage(str(tmp_path)))
+        file_manager.save_characters([{"id": 1}])
+        assert (tmp_path / "characters.json").exists()
+        file_manager.update_characters(lambda characters: characters.append({"id": 2}))
+        assert file_manager.load_characters() == [{"id": 1}, {"id": 2}]
+    finally:
+        storage_module.set_storage(previous)
+
+
+@pytest.mark.parametrize("path", ["../outside.jpg", "uploads/../../outside.jpg", "x/../../../../tmp/pwned/0.jpg"])
+def test_local_storage_refuses_paths_outside_root(tmp_path, path):
+    backend = LocalStorage(str(tmp_path / "root"))
+    with pytest.raises(ValueError):
+        backend.write_bytes(path, b"x")
+    assert not (tmp_path / "outside.jpg").exists()
+
+
+def test_s3_refuses_keys_outside_prefix(s3):
+    _, backend = s3
+    with pytest.raises(ValueError):
+        backend.write_bytes("uploads/../../other/0.jpg", b"x")
+
+
+def test_s3_listdir_versions_change_when_file_is_replaced(s3):
+    _, backend = s3
+    backend.write_bytes("uploads/2_laurent/questions.json", b"[]")
+    before = backend.listdir_versions("uploads/2_laurent")
+    backend.write_bytes("uploads/2_laurent/questions.json", b"[1]")
+    after = backend.listdir_versions("uploads/2_laurent")
+    assert list(before) == list(after) == ["questions.json"]
+    assert before != after
+
+
+def test_local_listdir_versions(tmp_path):
+    backend = LocalStorage(str(tmp_path))
+    backend.write_bytes("uploads/2_laurent/0.jpg", b"x")
+    backend.write_bytes("uploads/2_laurent/1.jpg", b"yy")
+    versions = backend.listdir_versions("uploads/2_laurent")
+    assert sorted(versions) == ["0.jpg", "1.jpg"]
+    assert versions["1.jpg"].endswith(":2")
+
+
+def test_cached_characters_are_reused_and_refreshed_by_updates(tmp_path):
+    from utils import file_manager
+    previous = storage_module.get_storage()
+    try:
+        backend = LocalStorage(str(tmp_path))
+        storage_module.set_storage(backend)
+        file_manager.save_characters([{"id": 1}])
+        assert file_manager.load_characters(cached=True) == [{"id": 1}]
+
+        # Another node rewrites the file: cached reads keep the last copy until the TTL
+        backend.write_bytes("characters.json", b'[{"id": 1}, {"id": 9}]')
+        assert file_manager.load_characters(cached=True) == [{"id": 1}]
+        assert file_manager.load_characters() == [{"id": 1}, {"id": 9}]
+
+        # Writes from this process are visible immediately
+        file_manager.update_characters(lambda characters: characters.append({"id": 2}))
+        assert file_manager.load_characters(cached=True) == [{"id": 1}, {"id": 9}, {"id": 2}]
+    finally:
+        storage_module.set_storage(previous)
+
+
+def test_cache_revalidates_expired_entries(s3, tmp_path):
+    client, backend = s3
+    backend.write_bytes("uploads/2_laurent/0.jpg", b"old")
+    cached = CachedStorage(backend, str(tmp_path), ttl=0)
+    assert cached.read_bytes("uploads/2_laurent/0.jpg") == b"old"
+
+    # Unchanged object: only a HEAD, served from the cache
+    client.calls.clear()
+    assert cached.read_bytes("uploads/2_laurent/0.jpg") == b"old"
+    assert client.calls == [("head_object", "app/uploads/2_laurent/0.jpg")]
+
+    # Rewritten by another node: fetched again
+    client.objects["bucket"]["app/uploads/2_laurent/0.jpg"] = b"new"
+    assert cached.read_bytes("uploads/2_laurent/0.jpg") == b"new"
+
+    # Deleted by another node (e.g. an import rollback): no stale copy
+    del client.objects["bucket"]["app/uploads/2_laurent/0.jpg"]
+    with pytest.raises(FileNotFoundError):
+        cached.read_bytes("uploads/2_laurent/0.jpg")
+    assert not cached.exists("uploads/2_laurent/0.jpg")
+    assert not (tmp_path / "uploads/2_laurent/0.jpg").exists()
+
+
+def test_cache_evicts_least_recently_used_files(s3, tmp_path):
+    _, backend = s3
+    for name in ["a", "b", "c"]:
+        backend.write_bytes(f"uploads/{name}.jpg", b"x" * 10)
+    cached = CachedStorage(backend, str(tmp_path), max_bytes=25)
+
+    cached.read_bytes("uploads/a.jpg")
+    cached.read_bytes("uploads/b.jpg")
+    cached.read_bytes("uploads/a.jpg")
+    cached.read_bytes("uploads/c.jpg")
+
+    assert cached.stats()["bytes"] == 20
+    assert (tmp_path / "uploads/a.jpg").exists()
+    assert not (tmp_path / "uploads/b.jpg").exists()
+    assert (tmp_path / "uploads/c.jpg").exists()
+
+
+def test_cache_counts_files_left_by_previous_run(s3, tmp_path):
+    _, backend = s3
+    backend.write_bytes("uploads/a.jpg", b"fresh")
+    (tmp_path / "uploads").mkdir()
+    (tmp_path / "uploads/a.jpg").write_bytes(b"stale")
+
+    cached = CachedStorage(backend, str(tmp_path))
+    assert cached.stats()["bytes"] == 5
+    assert cached.read_bytes("uploads/a.jpg") == b"fresh"
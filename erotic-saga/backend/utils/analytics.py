@@ -0,0 +1,256 @@
+import os
+import time
+import sqlite3
+import threading
+from collections import deque, defaultdict
+
+# ===============================================
+# 🔹 Analytics configuration (environment variables)
+# ===============================================
+# ANALYTICS_DB             : SQLite file holding raw events and rollups
+# ANALYTICS_FLUSH_INTERVAL : seconds between two background flushes
+# ANALYTICS_BATCH_SIZE     : max events written per transaction
+# ANALYTICS_MAX_BUFFER     : max events kept in memory while SQLite is unavailable (oldest dropped first)
+
+ANALYTICS_DB = os.getenv("ANALYTICS_DB", "analytics.db")
+ANALYTICS_FLUSH_INTERVAL = float(os.getenv("ANALYTICS_FLUSH_INTERVAL", "2"))
+ANALYTICS_BATCH_SIZE = int(os.getenv("ANALYTICS_BATCH_SIZE", "1000"))
+ANALYTICS_MAX_BUFFER = int(os.getenv("ANALYTICS_MAX_BUFFER", "100000"))
+
+# Event types
+EVENT_VIEW = "view"            # a question was shown (question 1 = a game started)
+EVENT_ANSWER = "answer"        # an answer was submitted (correct or not)
+EVENT_WIN = "win"              # the player answered the last question
+EVENT_GAME_OVER = "game_over"  # the player answered wrong
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    ts REAL NOT NULL,
+    event TEXT NOT NULL,
+    character_id INTEGER NOT NULL,
+    question_id INTEGER,
+    correct INTEGER
+);
+CREATE TABLE IF NOT EXISTS character_stats (
+    character_id INTEGER PRIMARY KEY,
+    games_started INTEGER NOT NULL DEFAULT 0,
+    answers INTEGER NOT NULL DEFAULT 0,
+    correct_answers INTEGER NOT NULL DEFAULT 0,
+    wins INTEGER NOT NULL DEFAULT 0,
+    game_overs INTEGER NOT NULL DEFAULT 0,
+    last_event_at REAL
+);
+CREATE TABLE IF NOT EXISTS question_stats (
+    character_id INTEGER NOT NULL,
+    question_id INTEGER NOT NULL,
+    views INTEGER NOT NULL DEFAULT 0,
+    answers INTEGER NOT NULL DEFAULT 0,
+    correct_answers INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (character_id, question_id)
+);
+"""
+
+CHARACTER_COLUMNS = ("games_started", "answers", "correct_answers", "wins", "game_overs")
+QUESTION_COLUMNS = ("views", "answers", "correct_answers")
+
+
+def _rate(part: int, total: int):
+    return round(part / total, 4) if total else None
+
+
+class AnalyticsPipeline:
+    """
+    In-process gameplay analytics.
+    - record() only appends a tuple to a deque (atomic, no lock), so the answer path is not slowed down.
+      The deque is bounded: if SQLite keeps failing, the oldest events are dropped and counted.
+    - A background thread drains the buffer in batches into SQLite: raw events are appended to
+      `events` and the per-character / per-question rollups are updated in the same transaction.
+    - Stats queries read the rollup tables only, never the raw events.
+    """
+
+    def __init__(self, db_path: str = ANALYTICS_DB, flush_interval: float = ANALYTICS_FLUSH_INTERVAL,
+                 batch_size: int = ANALYTICS_BATCH_SIZE, max_buffer: int = ANALYTICS_MAX_BUFFER):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._buffer = deque(maxlen=max(1, max_buffer))
+        self.dropped = 0
+        self._stop = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    # ---------- Recording ----------
+
+    def record(self, event: str, character_id: int, question_id: int = None, correct: bool = None):
+        """
+        Queue an event (non-blocking). It is written to disk by the next flush.
+        """
+        if len(self._buffer) == self._buffer.maxlen:
+            # append() below pushes out the oldest event
+            self.dropped += 1
+        self._buffer.append((time.time(), event, character_id, question_id, None if correct is None else int(correct)))
+
+    # ---------- Background flushing ----------
+
+    def start(self):
+        conn = self._connect()
+        with conn:
+            conn.executescript(SCHEMA)
+        conn.close()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="analytics-flusher", daemon=True)
+        self._thread.start()
+        print(f"📊 Analytics pipeline started ({self.db_path})")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+        # Last flush on shutdown: log failures instead of breaking the app's shutdown
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"❌ Analytics final flush failed, {len(self._buffer)} events lost: {e}")
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"❌ Analytics flush failed, {len(self._buffer)} events kept for retry "
+                      f"({self.dropped} dropped so far): {e}")
+
+    def flush(self) -> int:
+        """
+        Write buffered events in batches. Returns the number of events written.
+        If a batch cannot be written, it is put back at the front of the buffer (in order)
+        and the error is raised, so the next flush retries it instead of losing it.
+        """
+        written = 0
+        with self._flush_lock:
+            while self._buffer:
+                batch = []
+                while self._buffer and len(batch) < self.batch_size:
+                    batch.append(self._buffer.popleft())
+                try:
+                    self._write_batch(batch)
+                except BaseException:
+                    # Put the batch back in front; if new events filled the buffer meanwhile,
+                    # drop the oldest ones of the batch (extendleft would drop the newest)
+                    overflow = max(0, len(self._buffer) + len(batch) - self._buffer.maxlen)
+                    self.dropped += overflow
+                    self._buffer.extendleft(reversed(batch[overflow:]))
+                    raise
+                written += len(batch)
+        return written
+
+    def _write_batch(self, batch):
+        # Aggregate the batch in memory first: one upsert per character / question
+        character_rows = defaultdict(lambda: dict.fromkeys(CHARACTER_COLUMNS, 0))
+        question_rows = defaultdict(lambda: dict.fromkeys(QUESTION_COLUMNS, 0))
+        last_event_at = {}
+
+        for ts, event, character_id, question_id, correct in batch:
+            c = character_rows[character_id]
+            last_event_at[character_id] = max(ts, last_event_at.get(character_id, 0))
+            if event == EVENT_VIEW:
+                question_rows[(character_id, question_id)]["views"] += 1
+                if question_id == 1:
+                    c["games_started"] += 1
+            elif event == EVENT_ANSWER:
+                q = question_rows[(character_id, question_id)]
+                q["answers"] += 1
+                c["answers"] += 1
+                if correct:
+                    q["correct_answers"] += 1
+                    c["correct_answers"] += 1
+            elif event == EVENT_WIN:
+                c["wins"] += 1
+            elif event == EVENT_GAME_OVER:
+                c["game_overs"] += 1
+
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO events (ts, event, character_id, question_id, correct) VALUES (?, ?, ?, ?, ?)",
+                    batch
+                )
+                conn.executemany(
+                    f"""INSERT INTO character_stats (character_id, {", ".join(CHARACTER_COLUMNS)}, last_event_at)
+                    VALUES (?, {", ".join("?" for _ in CHARACTER_COLUMNS)}, ?)
+                    ON CONFLICT(character_id) DO UPDATE SET
+                    {", ".join(f"{col} = {col} + excluded.{col}" for col in CHARACTER_COLUMNS)},
+                    last_event_at = MAX(COALESCE(last_event_at, 0), excluded.last_event_at)""",
+                    [
+                        (cid, *(row[col] for col in CHARACTER_COLUMNS), last_event_at[cid])
+                        for cid, row in character_rows.items()
+                    ]
+                )
+                conn.executemany(
+                    f"""INSERT INTO question_stats (character_id, question_id, {", ".join(QUESTION_COLUMNS)})
+                    VALUES (?, ?, {", ".join("?" for _ in QUESTION_COLUMNS)})
+                    ON CONFLICT(character_id, question_id) DO UPDATE SET
+                    {", ".join(f"{col} = {col} + excluded.{col}" for col in QUESTION_COLUMNS)}""",
+                    [
+                        (cid, qid, *(row[col] for col in QUESTION_COLUMNS))
+                        for (cid, qid), row in question_rows.items()
+                    ]
+                )
+        finally:
+            conn.close()
+
+    # ---------- Aggregates (rollup tables only) ----------
+
+    def _character_summary(self, row) -> dict:
+        stats = dict(zip(("character_id", *CHARACTER_COLUMNS, "last_event_at"), row))
+        stats["win_rate"] = _rate(stats["wins"], stats["games_started"])
+        stats["correct_rate"] = _rate(stats["correct_answers"], stats["answers"])
+        return stats
+
+    def all_character_stats(self) -> list[dict]:
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"SELECT character_id, {', '.join(CHARACTER_COLUMNS)}, last_event_at FROM character_stats ORDER BY character_id"
+            ).fetchall()
+        finally:
+            conn.close()
+        return [self._character_summary(row) for row in rows]
+
+    def character_stats(self, character_id: int) -> dict:
+        """
+        Return the rollup of one character plus per-question difficulty stats.
+        """
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                f"SELECT character_id, {', '.join(CHARACTER_COLUMNS)}, last_event_at FROM character_stats WHERE character_id = ?",
+                (character_id,)
+            ).fetchone()
+            question_rows = conn.execute(
+                f"SELECT question_id, {', '.join(QUESTION_COLUMNS)} FROM question_stats WHERE character_id = ? ORDER BY question_id",
+                (character_id,)
+            ).fetchall()
+        finally:
+            conn.close()
+
+        stats = self._character_summary(row) if row else self._character_summary(
+            (character_id, *(0 for _ in CHARACTER_COLUMNS), None)
+        )
+        questions = []
+        for q in question_rows:
+            q_stats = dict(zip(("question_id", *QUESTION_COLUMNS), q))
+            q_stats["correct_rate"] = _rate(q_stats["correct_answers"], q_stats["answers"])
+            questions.append(q_stats)
+        stats["questions"] = questions
+        return stats
+
+
+# Shared pipeline used by the gameplay handlers
+analytics = AnalyticsPipeline()
@@ -0,0 +1,310 @@
+import io
+import os
+import json
+import tarfile
+import zipfile
+import zlib
+from utils.file_manager import storage, list_character_images, name_from_folder, safe_folder_name, allocate_character_ids, folder_ids, update_characters, reserved_record, public_record, publish_characters, discard_reserved_characters, UPLOAD_DIR, IMAGE_EXTENSIONS
+from utils.question_loader import validate_questions
+
+# Supported archive formats → MIME type
+ARCHIVE_FORMATS = {
+    "zip": "application/zip",
+    "tar": "application/x-tar",
+    "tar.gz": "application/gzip",
+}
+
+# Errors raised by zipfile / tarfile on truncated or corrupt archives
+ARCHIVE_READ_ERRORS = (tarfile.TarError, zipfile.BadZipFile, zlib.error, EOFError, OSError)
+
+# Optional manifest at the root of the archive: [{"folder": "2_laurent", "name": "Laurent"}, ...]
+MANIFEST_FILE = "characters.json"
+
+
+class _StreamBuffer:
+    """
+    Write-only file object that collects archive bytes until they are yielded.
+    It has no tell()/seek(), so zipfile/tarfile write the archive sequentially.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+# ===============================================
+# 🔹 Export: stream characters as an archive
+# ===============================================
+
+def _export_files(character):
+    """
+    Return the file names of a character folder that belong in an export.
+    """
+    folder = character["folder"]
+    files = list_character_images(folder)
+    if storage.exists(os.path.join(folder, "questions.json")):
+        files.append("questions.json")
+    return files
+
+
+def iter_export_archive(characters, fmt: str = "zip"):
+    """
+    Yield the bytes of an archive containing one folder per character
+    ({id}_{name}/0.jpg, 1.jpg, ..., questions.json) plus a characters.json manifest.
+    Files are read one by one, so memory usage stays flat for large catalogs.
+    """
+    buffer = _StreamBuffer()
+    manifest = [
+        {"folder": os.path.basename(os.path.normpath(c["folder"])), "name": c["name"]}
+        for c in characters
+    ]
+
+    if fmt == "zip":
+        archive = zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_STORED)
+
+        def add_file(name, data):
+            archive.writestr(name, data)
+    else:
+        archive = tarfile.open(fileobj=buffer, mode="w|gz" if fmt == "tar.gz" else "w|")
+
+        def add_file(name, data):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+
+    add_file(MANIFEST_FILE, json.dumps(manifest, ensure_ascii=False, indent=2).encode("utf-8"))
+    yield buffer.pop()
+
+    for character, entry in zip(characters, manifest):
+        for filename in _export_files(character):
+            try:
+                data = storage.read_bytes(os.path.join(character["folder"], filename))
+            except FileNotFoundError:
+                print(f"⚠️ Export: {character['folder']}/{filename} disappeared, skipping.")
+                continue
+            add_file(f"{entry['folder']}/{filename}", data)
+            yield buffer.pop()
+
+    archive.close()
+    yield buffer.pop()
+
+
+# ===============================================
+# 🔹 Import: validate + commit an archive
+# ===============================================
+
+class _ArchiveReader:
+    """
+    Uniform view over zip and tar archives: members() lists file names, read() returns bytes.
+    Corrupt or truncated archives raise ValueError with a readable message.
+    """
+
+    def __init__(self, fileobj):
+        fileobj.seek(0)
+        if zipfile.is_zipfile(fileobj):
+            fileobj.seek(0)
+            self._zip = zipfile.ZipFile(fileobj)
+            self._tar = None
+        else:
+            fileobj.seek(0)
+            try:
+                self._tar = tarfile.open(fileobj=fileobj, mode="r:*")
+            except ARCHIVE_READ_ERRORS:
+                raise ValueError("Archive must be a .zip, .tar or .tar.gz file")
+            self._zip = None
+
+    def members(self) -> list[str]:
+        try:
+            if self._zip:
+                return [i.filename for i in self._zip.infolist() if not i.is_dir()]
+            return [m.name for m in self._tar.getmembers() if m.isfile()]
+        except ARCHIVE_READ_ERRORS as e:
+            raise ValueError(f"Archive is corrupt or truncated: {e}")
+
+    def read(self, name: str) -> bytes:
+        try:
+            if self._zip:
+                return self._zip.read(name)
+            return self._tar.extractfile(name).read()
+        except ARCHIVE_READ_ERRORS as e:
+            raise ValueError(f"{name}: corrupt or truncated archive member ({e})")
+
+    def close(self):
+        (self._zip or self._tar).close()
+
+
+def _split_member(name: str):
+    """
+    Split "2_laurent/0.jpg" into ("2_laurent", "0.jpg").
+    Returns (None, filename) for root files. Raises ValueError for unsafe paths and for files
+    nested deeper than one folder (the layout written by the export is <folder>/<file>).
+    """
+    parts = [p for p in name.replace("\\", "/").split("/") if p not in ("", ".")]
+    if not parts or name.startswith("/") or ".." in parts:
+        raise ValueError(f"Unsafe path in archive: {name}")
+    if len(parts) > 2:
+        raise ValueError(f"Nested folder in archive: {name} (expected <character folder>/<file>)")
+    if len(parts) == 1:
+        return None, parts[0]
+    return parts[0], parts[1]
+
+
+def scan_character_archive(fileobj):
+    """
+    Read an archive and validate every character folder in one pass.
+    Returns (entries, errors, warnings); nothing is written to storage.
+    Each entry: {"folder", "name", "files": {filename: member}, "questions"}.
+    """
+    try:
+        reader = _ArchiveReader(fileobj)
+    except (ValueError, *ARCHIVE_READ_ERRORS) as e:
+        return [], [str(e)], []
+
+    errors = []
+    warnings = []
+    folders = {}
+    manifest_names = {}
+
+    try:
+        try:
+            members = reader.members()
+        except ValueError as e:
+            return [], [str(e)], []
+
+        for member in members:
+            try:
+                folder, filename = _split_member(member)
+            except ValueError as e:
+                errors.append(str(e))
+                continue
+
+            if filename == MANIFEST_FILE:
+                try:
+                    manifest = json.loads(reader.read(member).decode("utf-8"))
+                    manifest_names.update({m["folder"]: m["name"] for m in manifest})
+                except Exception as e:
+                    errors.append(f"{member}: invalid manifest ({e})")
+                continue
+
+            if folder is None:
+                continue
+            if filename == "questions.json" or filename.lower().endswith(IMAGE_EXTENSIONS):
+                files = folders.setdefault(folder, {})
+                if filename in files:
+                    # e.g. the same entry twice in a zip, or "2_x/0.jpg" next to "./2_x/0.jpg"
+                    errors.append(f"{folder}: duplicate file {filename}")
+                    continue
+                files[filename] = member
+
+        for folder, name in manifest_names.items():
+            if not isinstance(name, str) or any(bad in name for bad in ("/", "\\", "..")):
+                errors.append(f"{MANIFEST_FILE}: invalid name for {folder}: {name!r}")
+
+        entries = []
+        for folder, files in sorted(folders.items()):
+            sources = [f for f in files if os.path.splitext(f)[0] == "0" and f != "questions.json"]
+            if len(sources) != 1:
+                errors.append(f"{folder}: expected exactly one source image 0.*, found {len(sources)}")
+
+            questions = None
+            if "questions.json" not in files:
+                errors.append(f"{folder}: missing questions.json")
+            else:
+                try:
+                    questions = json.loads(reader.read(files["questions.json"]).decode("utf-8"))
+                except (UnicodeDecodeError, json.JSONDecodeError) as e:
+                    errors.append(f"{folder}: invalid questions.json ({e})")
+                except ValueError as e:
+                    errors.append(f"{folder}: {e}")
+                else:
+                    errors.extend(f"{folder}: {err}" for err in validate_questions(questions))
+
+            generated = len([f for f in files if f != "questions.json"]) - len(sources)
+            if isinstance(questions, list) and generated < len(questions):
+                warnings.append(f"{folder}: {generated} generated images for {len(questions)} questions")
+
+            entries.append({
+                "folder": folder,
+                "name": manifest_names.get(folder) or name_from_folder(folder),
+                "files": files,
+                "questions": questions,
+            })
+    finally:
+        reader.close()
+
+    if not entries and not errors:
+        errors.append("Archive does not contain any character folders")
+
+    return entries, errors, warnings
+
+
+def import_character_archive(fileobj, entries):
+    """
+    Copy the validated entries from the archive into storage, all or nothing:
+    1. ids are reserved atomically in characters.json (same allocation as /api/upload),
+       with the records flagged "importing" so the game does not list them yet;
+    2. files are written to the reserved folders;
+    3. one more atomic update publishes every record at once.
+    If anything fails, the written files and the reserved records are removed.
+    Returns the list of new character records.
+    """
+    existing_folder_ids = folder_ids()
+
+    def reserve(characters):
+        ids = allocate_character_ids(characters, len(entries), exclude=existing_folder_ids)
+        records = []
+        for entry, new_id in zip(entries, ids):
+            character_folder = os.path.join(UPLOAD_DIR, f"{new_id}_{safe_folder_name(entry['name'])}")
+            source = next(f for f in entry["files"] if os.path.splitext(f)[0] == "0" and f != "questions.json")
+            records.append(reserved_record({
+                "id": new_id,
+                "name": entry["name"],
+                "original_image": os.path.join(character_folder, source),
+                "folder": character_folder
+            }))
+        characters.extend(records)
+        return records
+
+    reserved = update_characters(reserve)
+    reserved_ids = {r["id"] for r in reserved}
+    written = []
+
+    try:
+        reader = _ArchiveReader(fileobj)
+        try:
+            for entry, record in zip(entries, reserved):
+                for filename, member in entry["files"].items():
+                    path = os.path.join(record["folder"], filename)
+                    if filename == "questions.json":
+                        # Edit id to increase from 1
+                        questions = entry["questions"]
+                        for idx, q in enumerate(questions, start=1):
+                            q["id"] = idx
+                        data = json.dumps(questions, ensure_ascii=False, indent=2).encode("utf-8")
+                    else:
+                        data = reader.read(member)
+                    storage.write_bytes(path, data)
+                    written.append(path)
+        finally:
+            reader.close()
+    except BaseException:
+        print(f"⚠️ Import failed, rolling back {len(written)} files and {len(reserved)} reserved characters")
+        discard_reserved_characters(reserved_ids, written)
+        raise
+
+    publish_characters(reserved_ids)
+
+    new_characters = [public_record(r) for r in reserved]
+    print(f"✅ Imported {len(new_characters)} characters")
+    return new_characters
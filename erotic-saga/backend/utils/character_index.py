@@ -0,0 +1,423 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from utils.file_manager import storage, name_from_folder, load_characters, update_characters, UPLOAD_DIR, CHARACTERS_FILE, IMAGE_EXTENSIONS
+from utils.question_loader import load_questions_for_character, validate_questions
+
+# ===============================================
+# 🔹 Index configuration (environment variables)
+# ===============================================
+# INDEX_SNAPSHOT_FILE     : local snapshot used for fast warm starts
+# INDEX_WORKERS           : number of threads scanning character folders in parallel
+# INDEX_REPAIR_ON_STARTUP : "1" to repair inconsistencies on boot (default: only flag them)
+# INDEX_RESERVATION_TIMEOUT : seconds after which an unpublished upload / import reservation is stale
+# INDEX_RESCAN_INTERVAL   : min seconds between two rescans of a folder that is missing images
+
+INDEX_SNAPSHOT_FILE = os.getenv("INDEX_SNAPSHOT_FILE", ".character_index.json")
+INDEX_WORKERS = int(os.getenv("INDEX_WORKERS", "16"))
+INDEX_REPAIR_ON_STARTUP = os.getenv("INDEX_REPAIR_ON_STARTUP", "0") == "1"
+INDEX_RESERVATION_TIMEOUT = float(os.getenv("INDEX_RESERVATION_TIMEOUT", "3600"))
+INDEX_RESCAN_INTERVAL = float(os.getenv("INDEX_RESCAN_INTERVAL", "60"))
+
+SNAPSHOT_VERSION = 2
+
+
+def scan_character_folder(folder: str) -> dict:
+    """
+    Scan one character folder and return its manifest:
+    {"folder", "images", "question_count", "issues", "versions"}
+    """
+    versions = storage.listdir_versions(folder)
+    files = list(versions)
+    images = sorted(f for f in files if f.lower().endswith(IMAGE_EXTENSIONS))
+    issues = []
+    question_count = 0
+
+    if not files:
+        issues.append("missing_folder")
+    else:
+        try:
+            questions = load_questions_for_character(folder)
+        except FileNotFoundError:
+            issues.append("missing_questions")
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            issues.append("invalid_questions")
+        else:
+            if validate_questions(questions):
+                issues.append("invalid_questions")
+            if isinstance(questions, list):
+                question_count = len(questions)
+
+    if not any(os.path.splitext(f)[0] == "0" for f in images) and "missing_folder" not in issues:
+        issues.append("missing_source_image")
+
+    # Image 0 is the original; the game needs one generated image per question
+    if question_count and len(images) - 1 < question_count:
+        issues.append("not_enough_images")
+
+    return {
+        "folder": folder,
+        "images": images,
+        "question_count": question_count,
+        "issues": issues,
+        # File versions (mtime/size or ETag) used to validate the snapshot on warm starts
+        "versions": versions,
+    }
+
+
+class CharacterIndex:
+    """
+    In-memory id → manifest index of the uploads/ tree.
+    - build(): scan every character folder in parallel, flag (or repair) inconsistencies
+      and persist a snapshot.
+    - load_or_build(): reuse the snapshot when characters.json, the folder list and
+      every folder's file versions are unchanged (folders are listed, not read).
+    - images(): sorted image list for a character, rescanning folders still being generated.
+    - refresh(): rescan one folder and update its manifest and problems.
+    """
+
+    def __init__(self, snapshot_file: str = INDEX_SNAPSHOT_FILE, workers: int = INDEX_WORKERS,
+                 reservation_timeout: float = INDEX_RESERVATION_TIMEOUT,
+                 rescan_interval: float = INDEX_RESCAN_INTERVAL):
+        self.snapshot_file = snapshot_file
+        self.workers = workers
+        self.reservation_timeout = reservation_timeout
+        self.rescan_interval = rescan_interval
+        # Shared pool for folder scans (threads are only started when work is submitted)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="character-index")
+        self.manifests = {}
+        self.orphans = []
+        self.problems = []
+        self.repairs = []
+        self.fingerprint = None
+        self.built_at = None
+        self.scan_seconds = None
+        self.source = None
+        self._generating = set()  # ids whose images this process is generating
+        self._scanned_at = {}     # id -> time of its last single-folder rescan
+        self._lock = threading.Lock()
+
+    # ---------- Build / load ----------
+
+    def _fingerprint(self, folders) -> str:
+        """
+        Cheap signature of the tree: characters.json content + the list of character folders.
+        """
+        h = hashlib.sha1()
+        try:
+            h.update(storage.read_bytes(CHARACTERS_FILE))
+        except FileNotFoundError:
+            pass
+        h.update("\n".join(sorted(folders)).encode("utf-8"))
+        return h.hexdigest()
+
+    def load_or_build(self, repair: bool = False):
+        """
+        Warm start from the snapshot when it still matches the tree, otherwise do a full scan.
+        """
+        folders = storage.listdirs(UPLOAD_DIR)
+        fingerprint = self._fingerprint(folders)
+        if not repair and self._load_snapshot(fingerprint):
+            print(f"⚡ Character index loaded from snapshot ({len(self.manifests)} characters)")
+            return self.report()
+        return self.build(repair=repair)
+
+    def build(self, repair: bool = False):
+        """
+        Scan every character folder in parallel and rebuild the index.
+        - repair: fix what can be fixed safely (wrong original_image path, complete orphan folders,
+          reservations left by a crashed upload / import)
+        """
+        start = time.time()
+        all_characters = load_characters()
+        folders = storage.listdirs(UPLOAD_DIR)
+
+        # Characters still being imported are neither indexed nor reported as orphans.
+        # Reservations older than the timeout were left by a process that died before publishing.
+        known_folders = {os.path.normpath(c["folder"]) for c in all_characters}
+        characters = [c for c in all_characters if not c.get("importing")]
+        stale = [
+            c for c in all_characters
+            if c.get("importing") and start - c.get("reserved_at", 0) > self.reservation_timeout
+        ]
+        orphan_folders = [
+            os.path.join(UPLOAD_DIR, f) for f in folders
+            if os.path.normpath(os.path.join(UPLOAD_DIR, f)) not in known_folders
+        ]
+
+        scanned = list(self._pool.map(scan_character_folder, [c["folder"] for c in characters] + orphan_folders))
+        character_scans = scanned[:len(characters)]
+        orphan_scans = scanned[len(characters):]
+
+        manifests = {}
+        problems = []
+        seen_ids = set()
+        for char, scan in zip(characters, character_scans):
+            issues = self._character_issues(char, scan)
+            if char["id"] in seen_ids:
+                issues.append("duplicate_id")
+            seen_ids.add(char["id"])
+            manifests[char["id"]] = {**scan, "id": char["id"], "name": char["name"], "issues": issues}
+
+        repairs = []
+        if repair:
+            reaped, repairs = self._reap_reservations(stale)
+            stale = [c for c in stale if c["id"] not in reaped]
+            repairs += self._repair(characters, manifests, orphan_scans)
+        if repairs:
+            # Orphans may have been adopted: re-derive the orphan list
+            adopted = {m["folder"] for m in manifests.values()}
+            orphan_scans = [s for s in orphan_scans if s["folder"] not in adopted]
+
+        for m in manifests.values():
+            problems.extend({"id": m["id"], "folder": m["folder"], "issue": i} for i in m["issues"])
+        problems.extend({"id": None, "folder": s["folder"], "issue": "orphan_folder"} for s in orphan_scans)
+        problems.extend({"id": c["id"], "folder": c["folder"], "issue": "stale_reservation"} for c in stale)
+
+        with self._lock:
+            self.manifests = manifests
+            self.orphans = [s["folder"] for s in orphan_scans]
+            self.problems = problems
+            self.repairs = repairs
+            self.fingerprint = self._fingerprint(storage.listdirs(UPLOAD_DIR))
+            self.built_at = time.time()
+            self.scan_seconds = round(time.time() - start, 3)
+            self.source = "scan"
+
+        self._save_snapshot()
+        print(f"✅ Character index built: {len(manifests)} characters, {len(problems)} issues, "
+              f"{len(repairs)} repairs in {self.scan_seconds}s")
+        return self.report()
+
+    def _character_issues(self, char, scan) -> list[str]:
+        """
+        Issues of a registered character: those of its folder plus a wrong original_image path.
+        """
+        issues = list(scan["issues"])
+        original = char.get("original_image")
+        has_source = not {"missing_folder", "missing_source_image"} & set(issues)
+        if has_source and (not original or not storage.exists(original)):
+            issues.append("missing_original_image")
+        return issues
+
+    def _repair(self, characters, manifests, orphan_scans) -> list[str]:
+        """
+        Apply safe repairs in one atomic update of characters.json.
+        Returns a description of each repair.
+        """
+        # Point original_image to the 0.* image that actually exists
+        fixes = {}
+        for char in characters:
+            manifest = manifests[char["id"]]
+            if "missing_original_image" in manifest["issues"]:
+                source = next(f for f in manifest["images"] if os.path.splitext(f)[0] == "0")
+                fixes[char["id"]] = (char["folder"], os.path.join(char["folder"], source))
+
+        # Register orphan folders that contain a complete character (an image for every question,
+        # otherwise the game would end with an early win)
+        adoptable = [scan for scan in orphan_scans if not scan["issues"]]
+
+        if not fixes and not adoptable:
+            return []
+
+        def apply(current):
+            repairs, adopted = [], []
+            for char in current:
+                fix = fixes.get(char["id"])
+                if fix and char["folder"] == fix[0]:
+                    char["original_image"] = fix[1]
+                    repairs.append(f"Character {char['id']}: original_image → {fix[1]}")
+
+            known_folders = {os.path.normpath(c["folder"]) for c in current}
+            taken_ids = {c["id"] for c in current}
+            next_id = max(taken_ids, default=0) + 1
+            for scan in adoptable:
+                if os.path.normpath(scan["folder"]) in known_folders:
+                    continue
+                folder_name = os.path.basename(scan["folder"])
+                prefix = folder_name.split("_", 1)[0]
+                new_id = int(prefix) if prefix.isdigit() and int(prefix) not in taken_ids else next_id
+                taken_ids.add(new_id)
+                next_id = max(next_id, new_id + 1)
+                source = next(f for f in scan["images"] if os.path.splitext(f)[0] == "0")
+                new_character = {
+                    "id": new_id,
+                    "name": name_from_folder(folder_name),
+                    "original_image": os.path.join(scan["folder"], source),
+                    "folder": scan["folder"]
+                }
+                current.append(new_character)
+                adopted.append((new_character, scan))
+                repairs.append(f"Registered orphan folder {scan['folder']} as character {new_id}")
+            return repairs, adopted
+
+        repairs, adopted = update_characters(apply)
+
+        for char_id in fixes:
+            if "missing_original_image" in manifests[char_id]["issues"]:
+                manifests[char_id]["issues"].remove("missing_original_image")
+        for new_character, scan in adopted:
+            manifests[new_character["id"]] = {**scan, "id": new_character["id"], "name": new_character["name"]}
+        return repairs
+
+    def _reap_reservations(self, stale) -> tuple[set, list[str]]:
+        """
+        Remove reservations left by a crashed upload / import, then delete their partial files.
+        A record is only removed if it is still the same unpublished reservation.
+        Returns (reaped ids, description of each repair).
+        """
+        if not stale:
+            return set(), []
+        expected = {c["id"]: c.get("reserved_at") for c in stale}
+
+        def release(current):
+            reaped = [
+                c for c in current
+                if c["id"] in expected and c.get("importing") and c.get("reserved_at") == expected[c["id"]]
+            ]
+            reaped_ids = {c["id"] for c in reaped}
+            current[:] = [c for c in current if c["id"] not in reaped_ids or not c.get("importing")]
+            return reaped
+
+        reaped = update_characters(release)
+        repairs = []
+        for char in reaped:
+            for filename in storage.listdir(char["folder"]):
+                storage.delete(os.path.join(char["folder"], filename))
+            repairs.append(f"Reaped reservation {char['id']} ({char['folder']}) left by an interrupted upload / import")
+        return {c["id"] for c in reaped}, repairs
+
+    # ---------- Snapshot ----------
+
+    def _save_snapshot(self):
+        snapshot = {
+            "version": SNAPSHOT_VERSION,
+            "fingerprint": self.fingerprint,
+            "built_at": self.built_at,
+            "manifests": list(self.manifests.values()),
+            "orphans": self.orphans,
+            "problems": self.problems,
+        }
+        try:
+            tmp_path = f"{self.snapshot_file}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f, ensure_ascii=False)
+            os.replace(tmp_path, self.snapshot_file)
+        except OSError as e:
+            print(f"⚠️ Could not save character index snapshot: {e}")
+
+    def _load_snapshot(self, fingerprint: str) -> bool:
+        try:
+            with open(self.snapshot_file, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return False
+
+        if snapshot.get("version") != SNAPSHOT_VERSION or snapshot.get("fingerprint") != fingerprint:
+            return False
+
+        # Files added, deleted or replaced inside a folder do not change the fingerprint:
+        # compare every folder's file versions (one listing per folder, in parallel)
+        manifests = snapshot["manifests"]
+        current = self._pool.map(storage.listdir_versions, [m["folder"] for m in manifests])
+        changed = [m["folder"] for m, versions in zip(manifests, current) if versions != m.get("versions")]
+        if changed:
+            print(f"🔄 Character index snapshot is stale ({len(changed)} folders changed), rescanning...")
+            return False
+
+        with self._lock:
+            self.manifests = {m["id"]: m for m in snapshot["manifests"]}
+            self.orphans = snapshot["orphans"]
+            self.problems = snapshot["problems"]
+            self.repairs = []
+            self.fingerprint = fingerprint
+            self.built_at = snapshot["built_at"]
+            self.scan_seconds = None
+            self.source = "snapshot"
+        return True
+
+    # ---------- Lookups ----------
+
+    def refresh(self, character: dict) -> dict:
+        """
+        Rescan a single character folder (after upload, import or a generated image).
+        """
+        scan = scan_character_folder(character["folder"])
+        manifest = {
+            **scan,
+            "id": character["id"],
+            "name": character["name"],
+            "issues": self._character_issues(character, scan),
+        }
+        folder = os.path.normpath(character["folder"])
+        with self._lock:
+            self.manifests[character["id"]] = manifest
+            self._scanned_at[character["id"]] = time.time()
+            # Replace this character's problems (and its folder's orphan entry, e.g. after an import)
+            self.orphans = [o for o in self.orphans if os.path.normpath(o) != folder]
+            self.problems = [
+                p for p in self.problems
+                if p["id"] != character["id"] and not (p["id"] is None and os.path.normpath(p["folder"]) == folder)
+            ]
+            self.problems.extend(
+                {"id": character["id"], "folder": character["folder"], "issue": i} for i in manifest["issues"]
+            )
+        return manifest
+
+    def refresh_many(self, characters: list[dict]) -> list[dict]:
+        """
+        Rescan several character folders in parallel on the index thread pool (blocking).
+        """
+        return list(self._pool.map(self.refresh, characters))
+
+    def generation_started(self, character_id: int):
+        """
+        Mark a character whose images are being generated: images() rescans it on every call.
+        """
+        with self._lock:
+            self._generating.add(character_id)
+
+    def generation_finished(self, character_id: int):
+        with self._lock:
+            self._generating.discard(character_id)
+
+    def images(self, character: dict) -> list[str]:
+        """
+        Return the sorted image names of a character. Folders are rescanned when unknown,
+        while this process generates their images, and otherwise at most once every
+        INDEX_RESCAN_INTERVAL seconds while images are missing (e.g. generated on another node).
+        """
+        with self._lock:
+            manifest = self.manifests.get(character["id"])
+            generating = character["id"] in self._generating
+            scanned_at = self._scanned_at.get(character["id"], 0.0)
+        if (
+            manifest is None
+            or manifest["folder"] != character["folder"]
+            or generating
+            or (
+                {"not_enough_images", "missing_folder"} & set(manifest["issues"])
+                and time.time() - scanned_at > self.rescan_interval
+            )
+        ):
+            manifest = self.refresh(character)
+        return manifest["images"]
+
+    def report(self) -> dict:
+        with self._lock:
+            return {
+                "characters": len(self.manifests),
+                "orphans": list(self.orphans),
+                "problems": list(self.problems),
+                "repairs": list(self.repairs),
+                "source": self.source,
+                "built_at": self.built_at,
+                "scan_seconds": self.scan_seconds,
+            }
+
+
+# Shared index used by the API handlers
+character_index = CharacterIndex()
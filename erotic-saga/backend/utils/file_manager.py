@@ -1,11 +1,26 @@
 import base64
 import os
+import copy
 import json
+import re
+import time
+import threading
+from utils.storage import shared_storage, get_storage, LocalStorage
 
 UPLOAD_DIR = "uploads"
 CHARACTERS_FILE = "characters.json"
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".webp")
 
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+# CHARACTERS_CACHE_TTL : seconds gameplay requests may reuse the last read of characters.json
+# (writes from this process refresh it immediately; other nodes' writes show up after the TTL)
+CHARACTERS_CACHE_TTL = float(os.getenv("CHARACTERS_CACHE_TTL", "2"))
+
+# Shared storage backend (local disk or S3, see utils/storage.py).
+# This is a proxy, so utils.storage.set_storage() also applies to modules importing it.
+storage = shared_storage
+
+# Bundled app assets (e.g. default_background.jpg) always live next to the code
+local_assets = LocalStorage(".")
 
 
 def save_image_file(file):
@@ -18,46 +33,206 @@ def save_image_file(file):
     # Create the full file path
     path = os.path.join(UPLOAD_DIR, new_filename)
 
-    # Save the file in the directory
-    with open(path, "wb") as f:
-        f.write(file.file.read())
+    # Save the file in the storage backend
+    storage.write_bytes(path, file.file.read())
 
     return path
 
 
 def encode_image_base64(path):
-    with open(path, "rb") as f:
-        return base64.b64encode(f.read()).decode("utf-8")
+    return base64.b64encode(storage.read_bytes(path)).decode("utf-8")
 
 
-def image_to_base64_to_front_end(image_path):
+def image_to_base64_to_front_end(image_path, source=None):
+    """
+    Read an image and return it as a data URL, or None if it does not exist.
+    - source: storage to read from (defaults to the shared storage backend)
+    """
+    source = source or storage
     try:
         ext = os.path.splitext(image_path)[1].lower()  # get file extension (.png, .jpg, .jpeg)
         mime_type = "image/png"  # default
         if ext in [".jpg", ".jpeg"]:
             mime_type = "image/jpeg"
 
-        with open(image_path, "rb") as image_file:
-            image_base64 = base64.b64encode(image_file.read()).decode("utf-8")
-            image_data = f"data:{mime_type};base64,{image_base64}"
-    except FileNotFoundError:
+        image_base64 = base64.b64encode(source.read_bytes(image_path)).decode("utf-8")
+        image_data = f"data:{mime_type};base64,{image_base64}"
+    except (FileNotFoundError, IsADirectoryError):
         image_data = None
 
     return image_data
 
 
+def list_character_images(folder_path):
+    """
+    Return the image file names inside a character folder, sorted alphabetically
+    (0.jpg is the original image, 1.jpg, 2.jpg, ... are the AI-generated ones).
+    """
+    files = [
+        f for f in storage.listdir(folder_path)
+        if f.lower().endswith(IMAGE_EXTENSIONS)
+    ]
+    files.sort()
+    return files
+
+
+def safe_folder_name(name):
+    """
+    Turn a character name into a folder-safe slug: "Anna Maria!" → "anna_maria"
+    Only [a-z0-9_] is kept, so names can never add path separators or "..".
+    """
+    return re.sub(r"[^a-z0-9_]+", "_", name.lower()).strip("_") or "character"
+
+
+def name_from_folder(folder_name):
+    """
+    Derive a display name from a character folder name: "12_anna_maria" → "Anna Maria"
+    """
+    return re.sub(r"^\d+_", "", folder_name).replace("_", " ").strip().title() or folder_name
+
+
 # ===============================================
 # 🔹 Utility: Load & Save character list
 # ===============================================
 
-def load_characters():
-    if not os.path.exists(CHARACTERS_FILE):
-        with open(CHARACTERS_FILE, "w", encoding="utf-8") as f:
-            json.dump([], f, ensure_ascii=False, indent=2)
-    with open(CHARACTERS_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
+# Last characters.json read: {"backend", "expires_at", "characters"}
+_characters_cache = {}
+_characters_cache_lock = threading.Lock()
+
+
+def _remember_characters(characters):
+    with _characters_cache_lock:
+        _characters_cache.update(
+            backend=get_storage(),
+            expires_at=time.time() + CHARACTERS_CACHE_TTL,
+            characters=characters
+        )
+
+
+def load_characters(cached: bool = False):
+    """
+    Return the character list from characters.json.
+    - cached: reuse a read younger than CHARACTERS_CACHE_TTL (for read-only gameplay requests;
+      anything that writes the list must use update_characters instead)
+    """
+    if cached:
+        with _characters_cache_lock:
+            if (
+                _characters_cache.get("backend") is get_storage()
+                and _characters_cache["expires_at"] > time.time()
+            ):
+                return copy.deepcopy(_characters_cache["characters"])
+
+    try:
+        characters = json.loads(storage.read_bytes(CHARACTERS_FILE).decode("utf-8"))
+    except FileNotFoundError:
+        characters = []
+    _remember_characters(characters)
+    return copy.deepcopy(characters)
 
 
 def save_characters(characters):
-    with open(CHARACTERS_FILE, "w", encoding="utf-8") as f:
-        json.dump(characters, f, ensure_ascii=False, indent=2)
+    data = json.dumps(characters, ensure_ascii=False, indent=2)
+    storage.write_bytes(CHARACTERS_FILE, data.encode("utf-8"))
+    _remember_characters(copy.deepcopy(characters))
+
+
+def allocate_character_ids(characters, count, exclude=()):
+    """
+    Return `count` unused character ids: start at len(characters) + 1 and skip ids
+    already used in `characters` or listed in `exclude` (e.g. ids of existing folders).
+    Call it inside update_characters() so the ids are reserved atomically.
+    """
+    taken = {c.get("id", 0) for c in characters} | set(exclude)
+    ids = []
+    new_id = len(characters) + 1
+    while len(ids) < count:
+        if new_id not in taken:
+            ids.append(new_id)
+        new_id += 1
+    return ids
+
+
+def folder_ids():
+    """
+    Return the id prefixes of the folders in uploads/ ("3_anna" → 3), including orphans,
+    so new characters never write into a folder that already exists.
+    """
+    prefixes = (f.split("_", 1)[0] for f in storage.listdirs(UPLOAD_DIR))
+    return {int(p) for p in prefixes if p.isdigit()}
+
+
+def update_characters(update):
+    """
+    Atomically read-modify-write characters.json (file lock locally, conditional put on S3),
+    so concurrent writers on other workers or nodes never lose each other's changes.
+    - update: function receiving the current list; it changes it in place and may return a value.
+      It can be called more than once if another writer got in first, so keep it side-effect free.
+    Returns the value returned by the last call of `update`.
+    """
+    result = {}
+
+    def apply(data):
+        characters = json.loads(data.decode("utf-8")) if data else []
+        result["value"] = update(characters)
+        return json.dumps(characters, ensure_ascii=False, indent=2).encode("utf-8")
+
+    data = storage.update_bytes(CHARACTERS_FILE, apply)
+    _remember_characters(json.loads(data.decode("utf-8")))
+    return result.get("value")
+
+
+# ===============================================
+# 🔹 Reservations: register → write files → publish (or roll back)
+# ===============================================
+# New characters (upload, archive import) are first added to characters.json flagged
+# "importing", so their id and folder are taken but the game does not list them yet.
+# "reserved_at" lets the character index find reservations left by a crashed process.
+
+RESERVATION_FIELDS = ("importing", "reserved_at")
+
+
+def reserved_record(record):
+    """
+    Return a copy of a character record flagged as reserved (hidden until published).
+    """
+    return {**record, "importing": True, "reserved_at": time.time()}
+
+
+def public_record(record):
+    """
+    Return a character record without its reservation fields.
+    """
+    return {k: v for k, v in record.items() if k not in RESERVATION_FIELDS}
+
+
+def publish_characters(ids):
+    """
+    Clear the reservation flag of the given ids in one atomic update.
+    """
+    ids = set(ids)
+
+    def publish(characters):
+        for c in characters:
+            if c["id"] in ids:
+                for field in RESERVATION_FIELDS:
+                    c.pop(field, None)
+    update_characters(publish)
+
+
+def discard_reserved_characters(ids, written=()):
+    """
+    Roll back a failed upload / import: delete the files already written,
+    then remove the still-reserved records.
+    """
+    ids = set(ids)
+    for path in written:
+        try:
+            storage.delete(path)
+        except Exception as e:
+            print(f"⚠️ Could not delete {path}: {e}")
+
+    def release(characters):
+        characters[:] = [c for c in characters if not (c["id"] in ids and c.get("importing"))]
+    update_characters(release)
+
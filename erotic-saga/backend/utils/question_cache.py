@@ -0,0 +1,244 @@
+import os
+import copy
+import hashlib
+import json
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# ===============================================
+# 🔹 Question cache configuration (environment variables)
+# ===============================================
+# QUESTION_CACHE_TTL  : seconds a generated question set stays valid
+# QUESTION_CACHE_SIZE : max number of question sets kept (least recently used are evicted)
+# QUESTION_CACHE_SHARED : "1" to share cached sets across API keys (default: each key has its own entries)
+# WARM_TOPICS_FILE    : JSON list of {"topic", "difficulties", "num_questions"} to pre-generate
+# WARMER_API_KEY      : API key used by the background warmer (warmer is off without it)
+# WARMER_INTERVAL     : seconds between two warmer passes
+
+QUESTION_CACHE_TTL = int(os.getenv("QUESTION_CACHE_TTL", "3600"))
+QUESTION_CACHE_SIZE = int(os.getenv("QUESTION_CACHE_SIZE", "256"))
+QUESTION_CACHE_SHARED = os.getenv("QUESTION_CACHE_SHARED", "0") == "1"
+WARM_TOPICS_FILE = os.getenv("WARM_TOPICS_FILE", "warm_topics.json")
+WARMER_API_KEY = os.getenv("WARMER_API_KEY", "")
+WARMER_INTERVAL = int(os.getenv("WARMER_INTERVAL", "600"))
+
+
+def make_cache_key(api_key: str, topic: str, difficulties: list[int], num_questions: int, shared: bool = QUESTION_CACHE_SHARED):
+    """
+    Normalize a request so that "  Science " and "science" share the same entry.
+    Difficulty order is kept: each difficulty maps to the question at the same position.
+    Entries are scoped by a hash of the API key, so a key (even an invalid one) never gets
+    a set generated and paid for with another tenant's key, unless `shared` is enabled.
+    """
+    scope = "shared" if shared else hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+    return (scope, " ".join(topic.lower().split()), tuple(int(d) for d in difficulties), int(num_questions))
+
+
+class _InFlight:
+    """
+    A generation in progress: the Future waiters block on, plus the loader's own job handle
+    (reported through `on_submit`) and promotions requested before the job was submitted.
+    """
+
+    def __init__(self, loader_kwargs: dict):
+        self.future = Future()
+        self.loader_kwargs = loader_kwargs
+        self.job = None
+        self.pending_promotions = []
+
+
+class QuestionSetCache:
+    """
+    TTL + LRU cache of generated question sets.
+    Concurrent identical requests are coalesced: only the first one calls `loader`,
+    the others wait for its result. Failed generations (None) are not cached.
+    With `promote`, a waiter whose loader_kwargs differ from the owner's (e.g. an interactive
+    request joining a background warm-up) calls `promote(job, **its_loader_kwargs)` so the
+    shared job is not left behind lower priority work. The loader then receives an
+    `on_submit(job)` callback to report its job handle.
+    """
+
+    def __init__(self, loader, ttl: int = QUESTION_CACHE_TTL, max_size: int = QUESTION_CACHE_SIZE,
+                 shared: bool = QUESTION_CACHE_SHARED, promote=None):
+        self.loader = loader
+        self.promote = promote
+        self.shared = shared
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()  # key -> (expires_at, questions)
+        self._inflight = {}            # key -> _InFlight
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _get_fresh(self, key):
+        """
+        Return the cached questions for `key` if not expired (caller holds the lock).
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, questions = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return questions
+
+    def ttl_remaining(self, key) -> float:
+        with self._lock:
+            entry = self._entries.get(key)
+            return max(0.0, entry[0] - time.time()) if entry else 0.0
+
+    def get_or_generate(self, api_key: str, topic: str, difficulties: list[int], num_questions: int, force: bool = False, **loader_kwargs):
+        """
+        Return (questions, source) where source is "cache", "coalesced" or "generated".
+        - force: skip the cached value and regenerate (still coalesced with in-flight calls)
+        - loader_kwargs: extra arguments passed through to the loader
+        """
+        key = make_cache_key(api_key, topic, difficulties, num_questions, shared=self.shared)
+
+        with self._lock:
+            questions = None if force else self._get_fresh(key)
+            if questions is not None:
+                self.hits += 1
+                return copy.deepcopy(questions), "cache"
+
+            inflight = self._inflight.get(key)
+            owner = inflight is None
+            promote_job = None
+            if owner:
+                inflight = _InFlight(loader_kwargs)
+                self._inflight[key] = inflight
+                self.misses += 1
+            else:
+                self.coalesced += 1
+                if self.promote and loader_kwargs != inflight.loader_kwargs:
+                    if inflight.job is None:
+                        inflight.pending_promotions.append(loader_kwargs)
+                    else:
+                        promote_job = inflight.job
+
+        if not owner:
+            if promote_job is not None:
+                self.promote(promote_job, **loader_kwargs)
+            questions = inflight.future.result()
+            return copy.deepcopy(questions), "coalesced"
+
+        if self.promote:
+            loader_kwargs = {**loader_kwargs, "on_submit": lambda job: self._attach_job(inflight, job)}
+
+        try:
+            questions = self.loader(
+                api_key=api_key,
+                topic=topic,
+                difficulties=list(key[2]),
+                num_questions=key[3],
+                **loader_kwargs
+            )
+        except Exception as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            inflight.future.set_exception(e)
+            raise
+
+        with self._lock:
+            if questions:
+                self._entries[key] = (time.time() + self.ttl, questions)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+            self._inflight.pop(key, None)
+        inflight.future.set_result(questions)
+
+        return copy.deepcopy(questions), "generated"
+
+    def _attach_job(self, inflight: _InFlight, job):
+        """
+        Record the loader's job handle and apply promotions requested before it existed.
+        """
+        with self._lock:
+            inflight.job = job
+            pending, inflight.pending_promotions = inflight.pending_promotions, []
+        for kwargs in pending:
+            self.promote(job, **kwargs)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "inflight": len(self._inflight),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "ttl": self.ttl,
+                "max_size": self.max_size,
+                "shared": self.shared,
+            }
+
+
+def load_warm_topics(path: str = WARM_TOPICS_FILE) -> list[dict]:
+    """
+    Read the popular topics to pre-generate from warm_topics.json (empty list if missing).
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+    except Exception as e:
+        print(f"❌ Error reading {path}: {e}")
+        return []
+
+
+class QuestionWarmer:
+    """
+    Background thread that keeps question sets for popular topics in the cache,
+    regenerating each one before it expires.
+    """
+
+    def __init__(self, cache: QuestionSetCache, api_key: str, topics: list[dict], interval: int = WARMER_INTERVAL, **loader_kwargs):
+        self.cache = cache
+        self.api_key = api_key
+        self.topics = topics
+        self.interval = interval
+        self.loader_kwargs = loader_kwargs
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="question-warmer", daemon=True)
+
+    def start(self):
+        print(f"🔥 Question warmer started for {len(self.topics)} topics")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def warm_once(self):
+        for item in self.topics:
+            if self._stop.is_set():
+                return
+            try:
+                key = make_cache_key(self.api_key, item["topic"], item["difficulties"], item["num_questions"], shared=self.cache.shared)
+                # Refresh entries that would expire before the next pass
+                if self.cache.ttl_remaining(key) > self.interval:
+                    continue
+                questions, _ = self.cache.get_or_generate(
+                    api_key=self.api_key,
+                    topic=item["topic"],
+                    difficulties=item["difficulties"],
+                    num_questions=item["num_questions"],
+                    force=True,
+                    **self.loader_kwargs
+                )
+                if questions:
+                    print(f"🔥 Warmed {len(questions)} questions for '{item['topic']}'")
+            except Exception as e:
+                print(f"⚠️ Warmer failed for {item}: {e}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.warm_once()
+            self._stop.wait(self.interval)
@@ -1,5 +1,6 @@
 import os
 import json
+from utils.file_manager import storage
 
 QUESTIONS_FILE = os.path.join(os.path.dirname(__file__), "..", "questions.json")
 
@@ -8,7 +9,45 @@ def load_questions_for_character(character_folder: str):
     Load the questions.json file located inside a character's folder.
     """
     q_path = os.path.join(character_folder, "questions.json")
-    if not os.path.exists(q_path):
+    try:
+        data = storage.read_bytes(q_path)
+    except FileNotFoundError:
         raise FileNotFoundError(f"⚠️ questions.json not found in {character_folder}")
-    with open(q_path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return json.loads(data.decode("utf-8"))
+
+
+def validate_questions(questions) -> list[str]:
+    """
+    Validate a list of questions in one pass and return every error found
+    (an empty list means the questions are valid).
+    """
+    if not isinstance(questions, list):
+        return ["Questions must be an array"]
+
+    errors = []
+    required_fields = ["id", "question", "options", "answer"]
+    for idx, q in enumerate(questions, start=1):
+        # Check required fields
+        if not isinstance(q, dict):
+            errors.append(f"Question {idx} must be an object")
+            continue
+
+        missing = [field for field in required_fields if field not in q]
+        for field in missing:
+            errors.append(f"Question {idx} missing required field: {field}")
+        if "options" in missing:
+            continue
+
+        # Validate options
+        if not isinstance(q["options"], list):
+            errors.append(f"Question {idx}: options must be an array")
+            continue
+
+        if len(q["options"]) != 4:
+            errors.append(f"Question {idx}: must have exactly 4 options")
+
+        # Validate that answer is one of the options
+        if "answer" in q and q["answer"] not in q["options"]:
+            errors.append(f"Question {idx}: answer '{q['answer']}' must be one of the options")
+
+    return errors
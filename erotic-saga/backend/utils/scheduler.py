@@ -0,0 +1,284 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+# ===============================================
+# 🔹 Scheduler configuration (environment variables)
+# ===============================================
+# SCHEDULER_MAX_CONCURRENCY        : max EternalAI calls running at the same time
+# SCHEDULER_BACKGROUND_CONCURRENCY : max background calls (the rest is reserved for interactive work)
+# SCHEDULER_KEY_WEIGHTS            : JSON object {"<api_key>": weight} for fair-share weights (default 1)
+
+SCHEDULER_MAX_CONCURRENCY = int(os.getenv("SCHEDULER_MAX_CONCURRENCY", "8"))
+SCHEDULER_BACKGROUND_CONCURRENCY = int(os.getenv("SCHEDULER_BACKGROUND_CONCURRENCY", "6"))
+SCHEDULER_KEY_WEIGHTS = json.loads(os.getenv("SCHEDULER_KEY_WEIGHTS", "{}"))
+
+# Priority classes, highest first
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+PRIORITIES = (INTERACTIVE, BACKGROUND)
+
+# Number of recent queue waits kept per class for percentiles
+WAIT_SAMPLES = 500
+
+
+def mask_api_key(api_key: str) -> str:
+    """
+    Hide API keys in metrics: "sk-1234567890abcd" → "sk-1…abcd"
+    """
+    if not api_key or len(api_key) <= 8:
+        return "****"
+    return f"{api_key[:4]}…{api_key[-4:]}"
+
+
+class _Task:
+    def __init__(self, priority, api_key, fn, args, kwargs, start_tag, finish_tag):
+        self.priority = priority
+        self.api_key = api_key
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.start_tag = start_tag
+        self.finish_tag = finish_tag
+        self.future = Future()
+        self.enqueued_at = time.time()
+
+
+class _FairQueue:
+    """
+    Weighted fair queue of tasks for one priority class.
+    Each api_key has its own FIFO; tasks get virtual finish tags so that a key with
+    weight w receives ~w shares of the slots while other keys are waiting.
+    """
+
+    def __init__(self):
+        self.queues = {}        # api_key -> deque of _Task
+        self.last_finish = {}   # api_key -> finish tag of its last queued task
+        self.virtual_time = 0.0
+
+    def __len__(self):
+        return sum(len(q) for q in self.queues.values())
+
+    def tags(self, api_key: str, weight: float):
+        start = max(self.virtual_time, self.last_finish.get(api_key, 0.0))
+        finish = start + 1.0 / weight
+        self.last_finish[api_key] = finish
+        return start, finish
+
+    def push(self, task: _Task):
+        self.queues.setdefault(task.api_key, deque()).append(task)
+
+    def remove(self, task: _Task) -> bool:
+        """
+        Take a queued task out of the queue (for promotion). Returns False if it is not queued here.
+        """
+        queue = self.queues.get(task.api_key)
+        if not queue or task not in queue:
+            return False
+        queue.remove(task)
+        if not queue:
+            del self.queues[task.api_key]
+        return True
+
+    def pop(self) -> _Task:
+        api_key = min(self.queues, key=lambda k: self.queues[k][0].finish_tag)
+        task = self.queues[api_key].popleft()
+        if not self.queues[api_key]:
+            del self.queues[api_key]
+        self.virtual_time = max(self.virtual_time, task.start_tag)
+        # Forget idle keys that are behind virtual time (they restart at virtual time anyway)
+        if not self.queues:
+            self.last_finish.clear()
+        return task
+
+
+class AIScheduler:
+    """
+    Central scheduler for outbound EternalAI work.
+    - Priority classes: interactive work always runs before background work.
+    - Weighted fair queuing per api_key inside each class, so one tenant cannot starve others.
+    - Concurrency caps: `max_concurrency` calls in total, at most `background_concurrency`
+      of them background, which keeps slots free for interactive requests.
+    """
+
+    def __init__(self, max_concurrency: int = SCHEDULER_MAX_CONCURRENCY,
+                 background_concurrency: int = SCHEDULER_BACKGROUND_CONCURRENCY,
+                 weights: dict = None):
+        self.max_concurrency = max(1, max_concurrency)
+        self.limits = {
+            INTERACTIVE: self.max_concurrency,
+            BACKGROUND: max(1, min(background_concurrency, self.max_concurrency)),
+        }
+        self.weights = dict(SCHEDULER_KEY_WEIGHTS if weights is None else weights)
+        self._queues = {p: _FairQueue() for p in PRIORITIES}
+        self._running = {p: 0 for p in PRIORITIES}
+        self._completed = {p: 0 for p in PRIORITIES}
+        self._failed = {p: 0 for p in PRIORITIES}
+        self._promoted = {p: 0 for p in PRIORITIES}
+        self._waits = {p: deque(maxlen=WAIT_SAMPLES) for p in PRIORITIES}
+        self._max_wait = {p: 0.0 for p in PRIORITIES}
+        self._per_key = {}  # masked api_key -> {"queued", "running", "completed"}
+        self._cond = threading.Condition()
+        self._workers = []
+        self._stopping = False
+
+    # ---------- Public API ----------
+
+    def submit(self, priority: str, api_key: str, fn, *args, **kwargs) -> Future:
+        """
+        Queue `fn(*args, **kwargs)` and return a Future with its result.
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+
+        with self._cond:
+            if self._stopping:
+                raise RuntimeError("Scheduler is shutting down")
+            self._start_workers()
+            queue = self._queues[priority]
+            start, finish = queue.tags(api_key, max(float(self.weights.get(api_key, 1)), 0.01))
+            task = _Task(priority, api_key, fn, args, kwargs, start, finish)
+            queue.push(task)
+            self._key_stats(api_key)["queued"] += 1
+            self._cond.notify()
+        return task.future
+
+    def promote(self, future: Future, priority: str = INTERACTIVE) -> bool:
+        """
+        Move a still-queued task to a higher priority class (e.g. an interactive request
+        now waits for work that was submitted as background). Returns True if it was moved;
+        tasks already running, finished or already at that priority are left alone.
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+
+        with self._cond:
+            for p in PRIORITIES[PRIORITIES.index(priority) + 1:]:
+                task = next(
+                    (t for q in self._queues[p].queues.values() for t in q if t.future is future),
+                    None
+                )
+                if task is None or not self._queues[p].remove(task):
+                    continue
+                queue = self._queues[priority]
+                task.priority = priority
+                task.start_tag, task.finish_tag = queue.tags(
+                    task.api_key, max(float(self.weights.get(task.api_key, 1)), 0.01)
+                )
+                queue.push(task)
+                self._promoted[priority] += 1
+                self._cond.notify()
+                return True
+        return False
+
+    def shutdown(self):
+        """
+        Stop accepting work and fail every task still queued, so nobody waits forever on
+        its Future. Running tasks finish normally.
+        """
+        with self._cond:
+            self._stopping = True
+            dropped = []
+            for p in PRIORITIES:
+                queue = self._queues[p]
+                for tasks in queue.queues.values():
+                    dropped.extend(tasks)
+                queue.queues.clear()
+                queue.last_finish.clear()
+            for task in dropped:
+                self._key_stats(task.api_key)["queued"] -= 1
+                self._failed[task.priority] += 1
+            self._cond.notify_all()
+
+        for task in dropped:
+            if task.future.set_running_or_notify_cancel():
+                task.future.set_exception(RuntimeError("Scheduler is shutting down"))
+        if dropped:
+            print(f"⚠️ AI scheduler stopped with {len(dropped)} queued tasks, failing them")
+
+    def metrics(self) -> dict:
+        with self._cond:
+            classes = {}
+            for p in PRIORITIES:
+                waits = sorted(self._waits[p])
+                classes[p] = {
+                    "queued": len(self._queues[p]),
+                    "running": self._running[p],
+                    "limit": self.limits[p],
+                    "completed": self._completed[p],
+                    "failed": self._failed[p],
+                    "promoted": self._promoted[p],
+                    "wait_avg": round(sum(waits) / len(waits), 3) if waits else 0.0,
+                    "wait_p95": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 3) if waits else 0.0,
+                    "wait_max": round(self._max_wait[p], 3),
+                }
+            return {
+                "max_concurrency": self.max_concurrency,
+                "classes": classes,
+                "api_keys": {k: dict(v) for k, v in self._per_key.items()},
+            }
+
+    # ---------- Internals ----------
+
+    def _key_stats(self, api_key: str) -> dict:
+        return self._per_key.setdefault(mask_api_key(api_key), {"queued": 0, "running": 0, "completed": 0})
+
+    def _start_workers(self):
+        # Workers are started lazily so importing the module has no side effects
+        while len(self._workers) < self.max_concurrency:
+            worker = threading.Thread(target=self._worker, name=f"ai-scheduler-{len(self._workers)}", daemon=True)
+            self._workers.append(worker)
+            worker.start()
+
+    def _next_task(self):
+        """
+        Pick the next runnable task: highest priority class with queued work and a free slot.
+        """
+        for p in PRIORITIES:
+            if len(self._queues[p]) and self._running[p] < self.limits[p]:
+                return self._queues[p].pop()
+        return None
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                task = self._next_task()
+                while task is None:
+                    if self._stopping:
+                        return
+                    self._cond.wait()
+                    task = self._next_task()
+
+                wait = time.time() - task.enqueued_at
+                self._waits[task.priority].append(wait)
+                self._max_wait[task.priority] = max(self._max_wait[task.priority], wait)
+                self._running[task.priority] += 1
+                stats = self._key_stats(task.api_key)
+                stats["queued"] -= 1
+                stats["running"] += 1
+
+            if not task.future.set_running_or_notify_cancel():
+                failed = True
+            else:
+                failed = False
+                try:
+                    task.future.set_result(task.fn(*task.args, **task.kwargs))
+                except BaseException as e:
+                    failed = True
+                    task.future.set_exception(e)
+
+            with self._cond:
+                self._running[task.priority] -= 1
+                self._completed[task.priority] += 1
+                if failed:
+                    self._failed[task.priority] += 1
+                stats["running"] -= 1
+                stats["completed"] += 1
+                self._cond.notify_all()
+
+
+# Shared scheduler for every outbound EternalAI call
+ai_scheduler = AIScheduler()
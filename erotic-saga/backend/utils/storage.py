@@ -0,0 +1,499 @@
+import os
+import time
+import random
+import threading
+from collections import OrderedDict
+
+try:
+    import fcntl  # POSIX only: cross-process file locks for LocalStorage.update_bytes
+except ImportError:
+    fcntl = None
+
+
+# ===============================================
+# 🔹 Storage configuration (environment variables)
+# ===============================================
+# STORAGE_BACKEND   : "local" (default) or "s3"
+# STORAGE_ROOT      : base directory for the local backend (default: current dir)
+# S3_BUCKET         : bucket name for the s3 backend
+# S3_PREFIX         : optional key prefix inside the bucket
+# S3_ENDPOINT_URL   : custom endpoint (MinIO, LocalStack, moto server, ...)
+# STORAGE_CACHE_DIR : local read-through cache directory for the s3 backend
+# STORAGE_CACHE_MAX_BYTES : size cap of the local cache (least recently used files are evicted)
+# STORAGE_CACHE_TTL : seconds a cached file is served before its version is checked again
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local").lower()
+STORAGE_ROOT = os.getenv("STORAGE_ROOT", ".")
+S3_BUCKET = os.getenv("S3_BUCKET", "")
+S3_PREFIX = os.getenv("S3_PREFIX", "")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+STORAGE_CACHE_DIR = os.getenv("STORAGE_CACHE_DIR", ".storage_cache")
+STORAGE_CACHE_MAX_BYTES = int(os.getenv("STORAGE_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+STORAGE_CACHE_TTL = float(os.getenv("STORAGE_CACHE_TTL", "60"))
+
+# Files shared and rewritten by every node: never served from the local cache
+UNCACHED_PATHS = ("characters.json",)
+
+# Retries of a conditional S3 write when another node updated the object first
+S3_UPDATE_ATTEMPTS = 20
+
+
+def _normalize(path: str) -> str:
+    """
+    Turn a path like "uploads\\2_laurent/./0.jpg" into the key "uploads/2_laurent/0.jpg".
+    Paths stored in characters.json are used as keys as-is, so both backends agree on them.
+    Raises ValueError for paths that climb above the storage root ("../x", "a/../../x").
+    """
+    key = os.path.normpath(path.replace("\\", "/")).replace("\\", "/").lstrip("/")
+    if key == ".." or key.startswith("../"):
+        raise ValueError(f"Path escapes the storage root: {path}")
+    return key
+
+
+class LocalStorage:
+    """
+    Store files on the local disk, relative to `root`.
+    """
+
+    def __init__(self, root: str = "."):
+        self.root = root
+        self._update_lock = threading.Lock()
+
+    def _full_path(self, path: str) -> str:
+        full_path = os.path.join(self.root, _normalize(path))
+        # Also refuse paths that leave the root through a symlink
+        real_root = os.path.realpath(self.root)
+        if os.path.commonpath([real_root, os.path.realpath(full_path)]) != real_root:
+            raise ValueError(f"Path escapes the storage root: {path}")
+        return full_path
+
+    def read_bytes(self, path: str) -> bytes:
+        with open(self._full_path(path), "rb") as f:
+            return f.read()
+
+    def version(self, path: str):
+        """
+        Return the current version of a file ("<mtime_ns>:<size>"), or None if it does not exist.
+        """
+        try:
+            stat = os.stat(self._full_path(path))
+        except FileNotFoundError:
+            return None
+        return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+    def read_versioned(self, path: str):
+        """
+        Return (bytes, version) of a file.
+        """
+        data = self.read_bytes(path)
+        return data, self.version(path)
+
+    def write_bytes(self, path: str, data: bytes):
+        full_path = self._full_path(path)
+        os.makedirs(os.path.dirname(full_path) or ".", exist_ok=True)
+        # Write to a temp file first so readers never see a half-written file
+        tmp_path = f"{full_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, full_path)
+
+    def update_bytes(self, path: str, update) -> bytes:
+        """
+        Atomically replace a file with `update(current_bytes or None)` and return the new bytes.
+        Writers are serialized by a lock file (<path>.lock), so concurrent processes
+        on the same disk never lose each other's changes.
+        """
+        full_path = self._full_path(path)
+        os.makedirs(os.path.dirname(full_path) or ".", exist_ok=True)
+        with self._update_lock, open(f"{full_path}.lock", "a+b") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                try:
+                    current = self.read_bytes(path)
+                except FileNotFoundError:
+                    current = None
+                data = update(current)
+                self.write_bytes(path, data)
+                return data
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def exists(self, path: str) -> bool:
+        return os.path.isfile(self._full_path(path))
+
+    def listdir(self, folder: str) -> list[str]:
+        """
+        Return the names of the files (not sub-folders) directly inside `folder`.
+        """
+        full_path = self._full_path(folder)
+        if not os.path.isdir(full_path):
+            return []
+        return [
+            f for f in os.listdir(full_path)
+            if os.path.isfile(os.path.join(full_path, f))
+        ]
+
+    def listdir_versions(self, folder: str) -> dict:
+        """
+        Return {file name: version} for the files directly inside `folder`.
+        The version ("<mtime_ns>:<size>") changes whenever a file is replaced.
+        """
+        full_path = self._full_path(folder)
+        if not os.path.isdir(full_path):
+            return {}
+        versions = {}
+        with os.scandir(full_path) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    stat = entry.stat()
+                    versions[entry.name] = f"{stat.st_mtime_ns}:{stat.st_size}"
+        return versions
+
+    def listdirs(self, folder: str) -> list[str]:
+        """
+        Return the names of the sub-folders directly inside `folder`.
+        """
+        full_path = self._full_path(folder)
+        if not os.path.isdir(full_path):
+            return []
+        return [
+            f for f in os.listdir(full_path)
+            if os.path.isdir(os.path.join(full_path, f))
+        ]
+
+    def delete(self, path: str):
+        full_path = self._full_path(path)
+        try:
+            os.remove(full_path)
+        except FileNotFoundError:
+            pass
+        # Drop the folder once it is empty, like an S3 "folder" disappears with its last key
+        try:
+            os.rmdir(os.path.dirname(full_path))
+        except OSError:
+            pass
+
+
+class S3Storage:
+    """
+    Store files in an S3-compatible bucket. Keys mirror the local paths
+    (e.g. "uploads/2_laurent/0.jpg"), optionally under `prefix`.
+    Point `endpoint_url` at MinIO / LocalStack / moto to run against a local stand-in.
+    """
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: str = None, client=None):
+        if client is None:
+            try:
+                import boto3
+            except ImportError:
+                raise RuntimeError("⚠️ STORAGE_BACKEND=s3 requires the 'boto3' package (pip install boto3)")
+            client = boto3.client("s3", endpoint_url=endpoint_url)
+
+        self.client = client
+        self.bucket = bucket
+        self.prefix = _normalize(prefix) + "/" if prefix else ""
+
+    def _key(self, path: str) -> str:
+        return self.prefix + _normalize(path)
+
+    def _error_code(self, error):
+        return getattr(error, "response", {}).get("Error", {}).get("Code")
+
+    def _is_missing(self, error) -> bool:
+        return self._error_code(error) in ("404", "NoSuchKey", "NotFound")
+
+    def _is_conflict(self, error) -> bool:
+        return self._error_code(error) in ("412", "PreconditionFailed", "409", "ConditionalRequestConflict")
+
+    def read_bytes(self, path: str) -> bytes:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._key(path))
+        except Exception as e:
+            if self._is_missing(e):
+                raise FileNotFoundError(path)
+            raise
+        return response["Body"].read()
+
+    def version(self, path: str):
+        """
+        Return the ETag of an object, or None if it does not exist.
+        """
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(path)).get("ETag")
+        except Exception as e:
+            if self._is_missing(e):
+                return None
+            raise
+
+    def read_versioned(self, path: str):
+        """
+        Return (bytes, ETag) of an object in one GET.
+        """
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._key(path))
+        except Exception as e:
+            if self._is_missing(e):
+                raise FileNotFoundError(path)
+            raise
+        return response["Body"].read(), response.get("ETag")
+
+    def write_bytes(self, path: str, data: bytes):
+        self.client.put_object(Bucket=self.bucket, Key=self._key(path), Body=data)
+
+    def update_bytes(self, path: str, update) -> bytes:
+        """
+        Atomically replace an object with `update(current_bytes or None)` and return the new bytes.
+        Uses conditional writes (If-Match on the ETag read, If-None-Match for a new object)
+        and retries when another node wrote the object in between.
+        """
+        key = self._key(path)
+        for attempt in range(S3_UPDATE_ATTEMPTS):
+            try:
+                response = self.client.get_object(Bucket=self.bucket, Key=key)
+                current, condition = response["Body"].read(), {"IfMatch": response["ETag"]}
+            except Exception as e:
+                if not self._is_missing(e):
+                    raise
+                current, condition = None, {"IfNoneMatch": "*"}
+
+            data = update(current)
+            try:
+                self.client.put_object(Bucket=self.bucket, Key=key, Body=data, **condition)
+                return data
+            except Exception as e:
+                if not self._is_conflict(e):
+                    raise
+                time.sleep(random.uniform(0, 0.05 * (attempt + 1)))
+
+        raise RuntimeError(f"⚠️ Could not update {path}: too many concurrent writers")
+
+    def exists(self, path: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(path))
+            return True
+        except Exception as e:
+            if self._is_missing(e):
+                return False
+            raise
+
+    def _list(self, folder: str):
+        """
+        Yield (files, folders) pages of a delimiter listing under `folder`.
+        """
+        folder_key = self._key(folder).rstrip("/") + "/"
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=folder_key, Delimiter="/"):
+            files = {obj["Key"][len(folder_key):]: obj.get("ETag") for obj in page.get("Contents", [])}
+            folders = [p["Prefix"][len(folder_key):].rstrip("/") for p in page.get("CommonPrefixes", [])]
+            yield files, folders
+
+    def listdir(self, folder: str) -> list[str]:
+        return [f for files, _ in self._list(folder) for f in files if f]
+
+    def listdir_versions(self, folder: str) -> dict:
+        # The ETag changes whenever an object is replaced
+        return {f: etag for files, _ in self._list(folder) for f, etag in files.items() if f}
+
+    def listdirs(self, folder: str) -> list[str]:
+        return [d for _, folders in self._list(folder) for d in folders if d]
+
+    def delete(self, path: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(path))
+
+
+class CachedStorage:
+    """
+    Read-through local cache in front of a remote backend.
+    - Reads are served from `cache_dir` when present, otherwise fetched and cached.
+    - A cached file is trusted for `ttl` seconds; after that its backend version (ETag) is
+      checked, so files rewritten or deleted by another node are not served forever.
+    - The cache holds at most `max_bytes`; least recently used files are evicted.
+    - Writes go to the backend first, then refresh the cached copy.
+    - Paths in `uncached` (e.g. characters.json) always hit the backend,
+      because other nodes may change them at any time.
+    """
+
+    def __init__(self, backend, cache_dir: str, uncached: tuple = (),
+                 max_bytes: int = STORAGE_CACHE_MAX_BYTES, ttl: float = STORAGE_CACHE_TTL):
+        self.backend = backend
+        self.cache = LocalStorage(cache_dir)
+        self.uncached = {_normalize(p) for p in uncached}
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> [size, version, checked_at], least recently used first
+        self._size = 0
+        self._lock = threading.Lock()
+        self._load_existing()
+
+    def _load_existing(self):
+        """
+        Count files left by a previous run (oldest first). Their version is unknown,
+        so they are revalidated before being served.
+        """
+        root = self.cache.root
+        found = []
+        for dirpath, _, files in os.walk(root):
+            for f in files:
+                if f.endswith((".tmp", ".lock")):
+                    continue
+                full_path = os.path.join(dirpath, f)
+                stat = os.stat(full_path)
+                found.append((stat.st_mtime, os.path.relpath(full_path, root).replace(os.sep, "/"), stat.st_size))
+        with self._lock:
+            for _, key, size in sorted(found):
+                self._entries[key] = [size, None, 0.0]
+                self._size += size
+            self._evict()
+
+    def _cacheable(self, path: str) -> bool:
+        return _normalize(path) not in self.uncached
+
+    def _evict(self):
+        # Caller holds the lock
+        while self._size > self.max_bytes and self._entries:
+            key, (size, _, _) = self._entries.popitem(last=False)
+            self._size -= size
+            self.cache.delete(key)
+
+    def _store(self, path: str, data: bytes, version):
+        key = _normalize(path)
+        with self._lock:
+            self.cache.write_bytes(key, data)
+            old = self._entries.pop(key, None)
+            if old:
+                self._size -= old[0]
+            self._entries[key] = [len(data), version, time.time()]
+            self._size += len(data)
+            self._evict()
+
+    def _drop(self, path: str):
+        key = _normalize(path)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old:
+                self._size -= old[0]
+            self.cache.delete(key)
+
+    def _fresh_entry(self, path: str) -> bool:
+        """
+        True if `path` is cached and still valid (revalidates expired entries by version).
+        """
+        key = _normalize(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            self._entries.move_to_end(key)
+            if entry[2] + self.ttl > time.time():
+                return True
+            cached_version = entry[1]
+
+        version = self.backend.version(path)
+        if version is None or version != cached_version:
+            self._drop(path)
+            return False
+        with self._lock:
+            entry[2] = time.time()
+        return True
+
+    def read_bytes(self, path: str) -> bytes:
+        if not self._cacheable(path):
+            return self.backend.read_bytes(path)
+        if self._fresh_entry(path):
+            try:
+                return self.cache.read_bytes(path)
+            except FileNotFoundError:
+                self._drop(path)
+        data, version = self.backend.read_versioned(path)
+        self._store(path, data, version)
+        return data
+
+    def write_bytes(self, path: str, data: bytes):
+        self.backend.write_bytes(path, data)
+        if self._cacheable(path):
+            # The new version is unknown until the next check: refetched once after the TTL
+            self._store(path, data, None)
+
+    def update_bytes(self, path: str, update) -> bytes:
+        data = self.backend.update_bytes(path, update)
+        if self._cacheable(path):
+            self._store(path, data, None)
+        return data
+
+    def exists(self, path: str) -> bool:
+        if self._cacheable(path) and self._fresh_entry(path):
+            return True
+        return self.backend.exists(path)
+
+    def listdir(self, folder: str) -> list[str]:
+        return self.backend.listdir(folder)
+
+    def listdir_versions(self, folder: str) -> dict:
+        return self.backend.listdir_versions(folder)
+
+    def listdirs(self, folder: str) -> list[str]:
+        return self.backend.listdirs(folder)
+
+    def delete(self, path: str):
+        self.backend.delete(path)
+        self._drop(path)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"files": len(self._entries), "bytes": self._size, "max_bytes": self.max_bytes}
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def create_storage():
+    """
+    Build the storage backend selected by the STORAGE_* environment variables.
+    """
+    if STORAGE_BACKEND == "local":
+        return LocalStorage(STORAGE_ROOT)
+
+    if STORAGE_BACKEND == "s3":
+        if not S3_BUCKET:
+            raise RuntimeError("⚠️ STORAGE_BACKEND=s3 requires S3_BUCKET to be set")
+        backend = S3Storage(S3_BUCKET, prefix=S3_PREFIX, endpoint_url=S3_ENDPOINT_URL)
+        print(f"🪣 Using S3 storage: bucket={S3_BUCKET}, endpoint={S3_ENDPOINT_URL or 'AWS'}")
+        return CachedStorage(backend, STORAGE_CACHE_DIR, uncached=UNCACHED_PATHS)
+
+    raise RuntimeError(f"⚠️ Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+
+
+def get_storage():
+    """
+    Return the shared storage backend, creating it on first use.
+    """
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            _storage = create_storage()
+        return _storage
+
+
+def set_storage(storage):
+    """
+    Replace the shared storage backend (e.g. to point at a local S3 stand-in).
+    Takes effect everywhere, because modules use `shared_storage` instead of a captured backend.
+    """
+    global _storage
+    with _storage_lock:
+        _storage = storage
+
+
+class _SharedStorage:
+    """
+    Forward every call to the current shared backend (see get_storage / set_storage).
+    """
+
+    def __getattr__(self, name):
+        return getattr(get_storage(), name)
+
+
+shared_storage = _SharedStorage()